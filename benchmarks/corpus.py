@@ -0,0 +1,75 @@
+from sympy import (symbols, Integral, exp, sqrt, pi, oo, I, im, conjugate, Abs, sin, cos, expand, factor,
+    cancel, together, Add, Mul)
+from sympy.physics.quantum import hbar
+
+# Representative comparisons, modelled on the kinds of steps checksym checks in
+# practice. Each case is built fresh for every run, by a function returning either
+# ('compare', expr1, expr2, symbols) or ('change', expr, ops, symbols), where
+# ops are applied one after another with Compare.change.
+
+def gaussian_integral():
+    x = symbols("x", real=True)
+    a = symbols("a", positive=True)
+    return ('compare', Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), (a,))
+
+def gaussian_integral_moved_constants():
+    x, p = symbols("x p", real=True)
+    a = symbols("a", positive=True)
+    n = symbols("N", real=True)
+    expr1 = hbar*n**2*Integral(exp(-a**2*x**2/hbar**2), (x, -oo, oo))/2
+    expr2 = hbar**2*Integral(n**2*a**2*exp(-a**2*p**2/hbar**2)/hbar, (p, -oo, oo))/(2*a**2)
+    return ('compare', expr1, expr2, (a, n))
+
+def gaussian_integral_wrong_factor():
+    x = symbols("x", real=True)
+    a = symbols("a", positive=True)
+    return ('compare', Integral(exp(-a*x**2), (x, -oo, oo)), 2*sqrt(pi/a), (a,))
+
+def complex_symbol_integral():
+    z = symbols("z", complex=True)
+    x = symbols("x", real=True)
+    return ('compare', 2*Integral(im(z)*x**2, (x, -1, 1)), Integral(im(2*z)*x**2, (x, -1, 1)), (z,))
+
+def complex_gaussian():
+    n = symbols("n", positive=True)
+    x = symbols("x", real=True)
+    delta = symbols("Delta", complex=True, real_part_positive=True)
+    expr1 = n**2*Integral(exp(-x**2*(conjugate(delta)**2 + delta**2)/(2*Abs(delta)**4)), (x, -oo, oo))
+    expr2 = Integral(n**2*exp(-x**2*(conjugate(delta)**2 + delta**2)/(2*Abs(delta)**4)), (x, -oo, oo))
+    return ('compare', expr1, expr2, (n, delta))
+
+def polynomial_identity():
+    x, y = symbols("x y", real=True)
+    z = symbols("z", complex=True)
+    expr = (x + 2*y - I*z)**8
+    return ('compare', expr, expand(expr), (x, y, z))
+
+def rational_function_identity():
+    x, y = symbols("x y", real=True)
+    expr = (x**3 - y**3)/(x - y) + 1/(x + y)**2
+    return ('compare', expr, cancel(together(expr)), (x, y))
+
+def many_symbols():
+    xs = symbols("x0:8", real=True)
+    expr1 = Add(*(sin(x)**2 * exp(x) for x in xs)) * Mul(*(1 + x**2 for x in xs[:4]))
+    expr2 = Add(*((1 - cos(x)**2) * exp(x) for x in xs)) * Mul(*(1 + x**2 for x in xs[:4]))
+    return ('compare', expr1, expr2, xs)
+
+def change_chain():
+    x = symbols("x", real=True)
+    a = symbols("a", positive=True)
+    expr = (x + a)**4/(x**2 - a**2)*exp(-a*x) + sin(a*x)**2
+    ops = [expand, together, cancel, factor, lambda e: e.rewrite(exp), expand]
+    return ('change', expr, ops, (x, a))
+
+CORPUS = {
+    'gaussian_integral': gaussian_integral,
+    'gaussian_integral_moved_constants': gaussian_integral_moved_constants,
+    'gaussian_integral_wrong_factor': gaussian_integral_wrong_factor,
+    'complex_symbol_integral': complex_symbol_integral,
+    'complex_gaussian': complex_gaussian,
+    'polynomial_identity': polynomial_identity,
+    'rational_function_identity': rational_function_identity,
+    'many_symbols': many_symbols,
+    'change_chain': change_chain,
+}
@@ -0,0 +1,268 @@
+import argparse
+import ast
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy
+import scipy
+import sympy
+from checksym import Compare, __version__
+from sympy.core.cache import clear_cache
+from checksym.compare.impl import clear_caches as clear_checksym_caches
+from .corpus import CORPUS
+
+# Benchmarks for the comparison workloads in corpus.py.
+#
+#   python -m benchmarks.run --output new.json
+#   python -m benchmarks.run --output new.json --baseline old.json
+#
+# Each case runs once cold, with the process-wide caches cleared, and then
+# --repeat times warm, each time with a new Compare so its own result cache
+# doesn't hide the work.
+
+# Compare settings for each mode
+MODES = {
+    'default': {},
+    'numeric': {'tiers': ('float', 'doit', 'mpmath', 'evalf')},
+    'joint_cse': {'joint_cse': True},
+    'race': {'race': True},
+}
+
+# Tiers that mean the first numeric attempt wasn't enough
+FALLBACK_TIERS = ('doit', 'mpmath', 'evalf')
+
+# Import times, each measured in a new interpreter. The numeric modules should
+# only load once a comparison needs them.
+IMPORTS = {
+    'import checksym': 'import checksym',
+    'Compare()': 'from checksym import Compare; Compare()',
+}
+HEAVY_MODULES = ('sympy', 'numpy', 'scipy', 'mpmath')
+
+_IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+%s
+seconds = time.perf_counter() - start
+print(repr((seconds, [name for name in %r if name in sys.modules])))
+'''
+
+def run_case(case, settings):
+    """
+    Run one case with a new Compare. Returns the profile summary and a list of
+    (tier, outcome) for each comparison made.
+    """
+    (kind, *case) = case
+    compare = Compare(profile=True, **settings)
+    decisions = []
+    if kind == 'compare':
+        (expr1, expr2, symbols) = case
+        decisions.append(_decision(compare.compare_detailed(expr1, expr2, *symbols)))
+    else:
+        (expr, ops, symbols) = case
+        for op in ops:
+            applied = []
+            def recorded(expr, op=op):
+                applied.append(op(expr))
+                return applied[-1]
+            compare.change(expr, recorded, *symbols)
+            # change doesn't say which tier decided, but the comparison it made
+            # is in the Compare's cache, so this doesn't run it again
+            (new_expr,) = applied
+            decisions.append(_decision(compare.compare_detailed(expr, new_expr, *symbols)))
+            expr = new_expr
+    return (compare.profile_summary.summary(), decisions)
+
+def _decision(detailed):
+    result = detailed['result']
+    if result == None:
+        outcome = 'match'
+    elif result.get('error') or result.get('exception'):
+        outcome = 'error'
+    else:
+        outcome = 'mismatch'
+    return (detailed['tier'], outcome)
+
+def clear_caches():
+    clear_checksym_caches()
+    clear_cache()
+
+def benchmark(cases, modes, repeat):
+    results = []
+    for mode in modes:
+        for name in cases:
+            settings = MODES[mode]
+
+            # Building the expressions isn't part of what's measured
+            clear_caches()
+            case = CORPUS[name]()
+            start = time.perf_counter()
+            (summary, decisions) = run_case(case, settings)
+            cold = time.perf_counter() - start
+
+            warm = []
+            for _ in range(repeat):
+                case = CORPUS[name]()
+                start = time.perf_counter()
+                run_case(case, settings)
+                warm.append(time.perf_counter() - start)
+
+            # tracemalloc slows everything down, so memory gets a run of its own.
+            # Only this process is traced, not the children race starts.
+            clear_caches()
+            case = CORPUS[name]()
+            tracemalloc.start()
+            run_case(case, settings)
+            (_, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results.append({
+                'case': name,
+                'mode': mode,
+                'cold': cold,
+                'warm_min': min(warm) if warm else None,
+                'warm_median': statistics.median(warm) if warm else None,
+                'peak_memory': peak,
+                'phases': summary['timings'],
+                'counters': summary['counters'],
+                'tiers': [tier for (tier, _) in decisions],
+                'outcomes': [outcome for (_, outcome) in decisions],
+            })
+    return results
+
+def import_times(repeat):
+    """
+    Time each of IMPORTS. Returns {name: {'min', 'median', 'modules'}}, where
+    modules are the HEAVY_MODULES it loaded.
+    """
+    times = {}
+    for (name, statement) in IMPORTS.items():
+        runs = []
+        for _ in range(max(repeat, 1)):
+            output = subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT % (statement, HEAVY_MODULES)],
+                capture_output=True, text=True, check=True).stdout
+            runs.append(ast.literal_eval(output))
+        seconds = [seconds for (seconds, _) in runs]
+        times[name] = {'min': min(seconds), 'median': statistics.median(seconds), 'modules': runs[0][1]}
+    return times
+
+def summarize(results):
+    """
+    Per mode: the total time, how the comparisons were decided, and the fallback rates
+    """
+    summary = {}
+    for result in results:
+        mode = summary.setdefault(result['mode'], {'cold': 0, 'warm_median': 0, 'comparisons': 0,
+            'tiers': {}, 'fallbacks': 0, 'per_point_passes': 0, 'backend_passes': 0})
+        mode['cold'] += result['cold']
+        mode['warm_median'] += result['warm_median'] or 0
+        mode['comparisons'] += len(result['tiers'])
+        for tier in result['tiers']:
+            mode['tiers'][str(tier)] = mode['tiers'].get(str(tier), 0) + 1
+        mode['fallbacks'] += sum(1 for tier in result['tiers'] if tier in FALLBACK_TIERS)
+        # Backend passes that couldn't evaluate all the test value sets at once
+        counters = result['counters']
+        mode['backend_passes'] += counters.get('backend_passes', 0)
+        mode['per_point_passes'] += counters.get('backend_passes', 0) - counters.get('batch_passes', 0)
+    for mode in summary.values():
+        mode['fallback_rate'] = mode['fallbacks'] / mode['comparisons'] if mode['comparisons'] else 0
+        mode['per_point_rate'] = (mode['per_point_passes'] / mode['backend_passes']
+            if mode['backend_passes'] else 0)
+    return summary
+
+def environment():
+    return {
+        'checksym': __version__,
+        'python': platform.python_version(),
+        'sympy': sympy.__version__,
+        'numpy': numpy.__version__,
+        'scipy': scipy.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare_runs(baseline, current, threshold):
+    """
+    Match up the results of two runs by case and mode.
+
+    Returns a list of (case, mode, measure, baseline seconds, current seconds, ratio, regressed).
+    Import times are included with mode 'import'.
+    """
+    baseline_results = {(result['case'], result['mode']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = baseline_results.get((result['case'], result['mode']))
+        if old == None:
+            continue
+        for measure in ('cold', 'warm_median'):
+            if old.get(measure) and result.get(measure) != None:
+                ratio = result[measure] / old[measure]
+                rows.append((result['case'], result['mode'], measure, old[measure], result[measure], ratio,
+                    ratio > threshold))
+    for (name, times) in current.get('imports', {}).items():
+        old = baseline.get('imports', {}).get(name)
+        if old and old['median']:
+            ratio = times['median'] / old['median']
+            rows.append((name, 'import', 'median', old['median'], times['median'], ratio, ratio > threshold))
+    return rows
+
+def print_imports(imports, out):
+    out.write("\n%-36s %10s %10s  %s\n" % ('import', 'min', 'median', 'loaded'))
+    for (name, times) in imports.items():
+        out.write("%-36s %10.4f %10.4f  %s\n" % (name, times['min'], times['median'], ','.join(times['modules'])))
+
+def print_results(results, summary, out):
+    out.write("%-36s %-10s %10s %10s %10s  %s\n" % ('case', 'mode', 'cold', 'warm', 'peak KiB', 'tiers'))
+    for result in results:
+        warm = result['warm_median']
+        out.write("%-36s %-10s %10.4f %10s %10d  %s\n" % (result['case'], result['mode'], result['cold'],
+            '-' if warm == None else '%.4f' % warm, result['peak_memory'] // 1024, ','.join(map(str, result['tiers']))))
+    out.write("\n")
+    for (mode, totals) in summary.items():
+        out.write("%-10s cold %.3fs, warm %.3fs, fallback rate %.0f%%, per-point rate %.0f%%, tiers %s\n" % (mode,
+            totals['cold'], totals['warm_median'], 100*totals['fallback_rate'], 100*totals['per_point_rate'],
+            totals['tiers']))
+
+def print_comparison(rows, out):
+    out.write("\n%-36s %-10s %-12s %10s %10s %8s\n" % ('case', 'mode', 'measure', 'baseline', 'current', 'ratio'))
+    for (case, mode, measure, old, new, ratio, regressed) in rows:
+        out.write("%-36s %-10s %-12s %10.4f %10.4f %7.2fx%s\n" % (case, mode, measure, old, new, ratio,
+            '  REGRESSION' if regressed else ''))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark checksym comparisons")
+    parser.add_argument('--cases', nargs='+', choices=sorted(CORPUS), default=list(CORPUS))
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=3, help="Warm runs per case")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help="Report a regression when a time grows by more than this factor")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.cases, args.modes, args.repeat)
+    run = {'environment': environment(), 'results': results, 'summary': summarize(results),
+        'imports': import_times(args.repeat)}
+    print_results(results, run['summary'], sys.stdout)
+    print_imports(run['imports'], sys.stdout)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare_runs(baseline, run, args.threshold)
+        print_comparison(rows, sys.stdout)
+        if args.fail_on_regression and any(row[-1] for row in rows):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
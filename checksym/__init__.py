@@ -1,3 +1,23 @@
-from .compare import Compare, CompareException
-from .util.manipulation import remove
+import importlib
+from .version import __version__
+from .compare import CompareException
 
+# Loaded on first use, so `import checksym` stays quick. See checksym.compare.
+_lazy = {
+    'Compare': '.compare',
+    'PersistentResultCache': '.compare',
+    'Derivation': '.compare',
+    'remove': '.util.manipulation',
+}
+
+__all__ = ['CompareException', *_lazy]
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
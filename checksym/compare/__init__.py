@@ -1,2 +1,21 @@
+import importlib
 from .exception.compare_exception import CompareException
-from .compare import Compare
+
+# Loaded on first use, so importing checksym doesn't import sympy and the rest
+_lazy = {
+    'Compare': '.compare',
+    'PersistentResultCache': '.result_cache',
+    'Derivation': '.derivation',
+}
+
+__all__ = ['CompareException', *_lazy]
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
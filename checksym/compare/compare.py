@@ -1,26 +1,107 @@
+import asyncio
+import contextlib
+import contextvars
 import itertools
+import os
+import threading
+import weakref
 from sympy import *
-import functools
+import pickle
+import sys
 import sympy
-import numpy
-import mpmath
-from checksym.util import compare_to_significance, build_test_value_sets
+from checksym.util import compare_to_significance, build_test_value_sets, LRUCache, fold_tree, rebuild
 from pprint import pp
 import datetime
-from .impl import SciPyNumPy, Evalf, Mpmath
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from . import impl as backends
+from .impl import Exact
+from .exception import CompareException, BatchUnsupportedException, CancelledException, MISSING_SYMBOLS_MESSAGE
+from .deadline import run_with_deadline, race, process_context
+from .profile import Profile, ProfileSummary
+
+# Every tier, in the order they're tried. See Compare.
+TIERS = ('structural', 'canonical', 'exact', 'float', 'doit', 'mpmath', 'evalf')
+
+# Most terms multiplying out the products may produce before the canonical tier
+# gives up. A product of n binomials has 2**n terms.
+CANONICAL_MAX_TERMS = 1000
+
+# While acompare runs a comparison in a thread, an event set when the caller is cancelled
+_cancelled = contextvars.ContextVar('cancelled', default=None)
 
 class Compare:
 
-    def __init__(self, *, test_time_limit=None, convert_exceptions=True):
+    def __init__(self, *, test_time_limit=None, convert_exceptions=True, hard_time_limit=None, on_phase=None,
+        race=False, race_mpmath=False, result_cache=None, cache_size=256, cache_bytes=None, joint_cse=False,
+        tiers=TIERS, profile=False, executor=None, max_concurrent=None):
         """
         Args:
         test_time_limit: Execute no more than this many tests
         convert_exceptions: Don't throw exceptions. Return them as part of the result
+        hard_time_limit: Run each comparison in a child process, and kill it if it takes
+            more than this many seconds. The result then has 'timeout' set, and 'phase'
+            says what was running ('prepare', 'doit', 'lambdify' or 'evaluate').
+            The child is forked when this is the only thread. With other threads running,
+            as under acompare, it comes from a fork server instead, so the expressions
+            must then be picklable (implemented_function ones aren't).
+        on_phase: Called with the name of each phase as the comparison enters it
+        race: Run the direct and doit-first evaluations at the same time in child processes,
+            instead of one after the other, and use the first one that succeeds.
+            hard_time_limit then applies to the race as a whole. When it runs out, values
+            that differ are reported rather than the timeout.
+        race_mpmath: When racing, also run the Mpmath backend
+        result_cache: A PersistentResultCache to look results up in before evaluating
+            anything, and to store new results in. Timeouts, exceptions, and passes under
+            test_time_limit aren't stored.
+        cache_size: Number of compare and change results to keep in memory. None means unbounded.
+        cache_bytes: Approximate limit on the memory used by those results. None means unbounded.
+        joint_cse: Compile the two expressions together, so subexpressions they share,
+            such as integrals, are evaluated once per test value set. Helps when one
+            expression is a rewrite of the other, as with change.
+        tiers: The ways of deciding a comparison to try, cheapest first. Any subset of TIERS:
+            'structural': The expressions are identical.
+            'canonical': Their difference is 0 once products are multiplied out. Skipped
+                when that would give more than CANONICAL_MAX_TERMS terms.
+            'exact': When both are rational functions of the symbols with rational (or Gaussian
+                rational) coefficients, compare them exactly. They must then be the same
+                rational function, not just agree at the test values.
+            'float': Evaluate with SciPyNumPy. A failure here isn't final.
+            'doit': The same, after doit().
+            'mpmath': When the float tiers only gave zeros or NaNs, evaluate with Mpmath.
+            'evalf': When they only gave exceptions, evaluate with Evalf, which doesn't
+                depend on lambdify.
+            With race, 'float' and 'doit' run together as the 'race' tier.
+        profile: Record where the time goes. Results then have a 'profile' with the time
+            spent in each phase and counters (test value sets tried, backend passes, cache
+            hits), and each comparison is added to profile_summary. Set the level of the
+            'checksym.compare.profile' logger to DEBUG to log each phase as well.
+        executor: The concurrent.futures executor acompare, achange and acompare_many run
+            comparisons in. None means the event loop's default thread pool.
+        max_concurrent: Most comparisons those run at once. None means no limit beyond the executor's.
         """
         self.test_time_limit = test_time_limit
         self.convert_exceptions = convert_exceptions
+        self.hard_time_limit = hard_time_limit
+        self.on_phase = on_phase
+        self.race = race
+        self.race_mpmath = race_mpmath
+        self.result_cache = result_cache
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.joint_cse = joint_cse
+        self.tiers = tuple(tiers)
+        self.profile = profile
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        # The max_concurrent limit, for each event loop the async API is used from.
+        # A semaphore only works in the loop it was first used in.
+        self._semaphores = weakref.WeakKeyDictionary()
+        # Totals over every comparison this instance has run, when profiling
+        self.profile_summary = ProfileSummary()
+        # Results of compare and change, see cache.stats() for hits and misses
+        self.cache = LRUCache(maxsize=cache_size, maxbytes=cache_bytes, sizeof=_cache_entry_size)
 
-    @functools.lru_cache(maxsize=None)
     def compare(self, expr1, expr2, *symbols):
         """
         Compare the two expressions numerically, making replacements for the given symbols.
@@ -36,7 +117,104 @@ class Compare:
 
         The error 'TypeError: loop of ufunc does not support argument 0 of type Mul which has no callable exp method'
         in lambdify might mean that the list of symbols is incomplete.
+
+        Returns None if they match. Otherwise returns a dict describing the failure, including
+        'tier', the tier that decided, and 'tier_timings', the seconds spent in each tier.
+        """
+        return self.compare_detailed(expr1, expr2, *symbols)['result']
+
+    def compare_detailed(self, expr1, expr2, *symbols):
+        """
+        Like compare, but returns a dict whether or not the expressions match, with:
+        result: What compare returns
+        tier: The tier that decided, None for a timeout
+        tier_timings: Seconds spent in each tier that ran
+        profile: When profiling, see Profile.finish
+        """
+        return self.cache.get_or_compute(('compare', expr1, expr2, symbols),
+            lambda: self._compare_uncached(expr1, expr2, symbols))
+
+    def _compare_uncached(self, expr1, expr2, symbols):
+        if self.result_cache != None:
+            (found, result, timings) = self.result_cache.get(expr1, expr2, symbols, self._result_settings())
+            if found:
+                return _outcome(result, timings.get('tier'), timings.get('tiers', {}))
+
+        start = time.perf_counter()
+        if self.hard_time_limit != None and not self.race:
+            outcome = self._compare_with_deadline(expr1, expr2, symbols)
+        else:
+            outcome = self._compare(expr1, expr2, *symbols)
+
+        if 'profile' in outcome:
+            self.profile_summary.add(expr1, expr2, symbols, outcome['profile'])
+
+        result = outcome['result']
+        if self.result_cache != None and self._persistent(result):
+            timings = {'total': time.perf_counter() - start, 'tier': outcome['tier'], 'tiers': outcome['tier_timings']}
+            self.result_cache.put(expr1, expr2, symbols, result, timings, self._result_settings())
+        return outcome
+
+    def _result_settings(self):
+        """
+        The settings a result can depend on, for the result_cache key
         """
+        return (
+            ('tiers', self.tiers),
+            ('test_time_limit', self.test_time_limit),
+            ('convert_exceptions', self.convert_exceptions),
+            ('joint_cse', self.joint_cse),
+            ('race', self.race),
+            ('race_mpmath', self.race_mpmath),
+        )
+
+    def _persistent(self, result):
+        """
+        Whether to store a result in result_cache. Timeouts and exceptions may not
+        happen next time, and a pass that only tried test_time_limit test value sets
+        may not hold for the rest.
+        """
+        if result == None:
+            return self.test_time_limit == None
+        return not (result.get('timeout') or result.get('exception'))
+
+    def _compare(self, expr1, expr2, *symbols):
+        """
+        Run the tiers in turn until one decides. Returns the dict compare_detailed describes.
+        """
+        if not self.profile:
+            return self._compare_with_tiers(expr1, expr2, symbols, self.on_phase, None)
+        profile = Profile(self.on_phase)
+        outcome = self._compare_with_tiers(expr1, expr2, symbols, profile.phase, profile)
+        outcome['profile'] = profile.finish()
+        if outcome['result'] != None:
+            outcome['result']['profile'] = outcome['profile']
+        return outcome
+
+    def _compare_with_tiers(self, expr1, expr2, symbols, on_phase, profile):
+        if on_phase:
+            on_phase('prepare')
+        timings = {}
+
+        # The structural and canonical tiers would otherwise pass expressions
+        # with symbols that never get test values, where evaluating them fails
+        if missing_symbols(expr1, expr2, symbols):
+            exception = CompareException(MISSING_SYMBOLS_MESSAGE)
+            return _outcome(self._exception_result(expr1, expr2, symbols, exception), None, timings)
+
+        def timed(tier, fn):
+            _check_cancelled()
+            start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                timings[tier] = timings.get(tier, 0) + time.perf_counter() - start
+
+        if 'structural' in self.tiers and timed('structural', lambda: expr1 == expr2):
+            return _outcome(None, 'structural', timings)
+
+        if 'canonical' in self.tiers and timed('canonical', lambda: _canonically_equal(expr1, expr2)):
+            return _outcome(None, 'canonical', timings)
 
         # Imaginary parts, combined with integrals with limits at infinity, provoke
         # `NameError: name 'polar_lift' is not defined` errors.
@@ -49,44 +227,167 @@ class Compare:
         # Probably also need to consider both expressions, as one might be shifted version of the other.
         # Maybe we will need to address that later.
         if any(map(lambda x: not x.is_real, symbols)):
-            expr1 = replace_infinite_integrals(expr1)
-            expr2 = replace_infinite_integrals(expr2)
+            if profile:
+                profile.step('replace_infinite_integrals')
+            memo = {}
+            expr1 = replace_infinite_integrals(expr1, memo)
+            expr2 = replace_infinite_integrals(expr2, memo)
 
+        if profile:
+            profile.step('build_test_value_sets')
         test_value_sets = build_test_value_sets(*symbols)
 
-        significance = 10
-
-        impl = SciPyNumPy(expr1, expr2, symbols, significance, self.convert_exceptions)
+        # Rational functions can be compared exactly, and far faster
+        if 'exact' in self.tiers and Exact.applies(expr1, expr2, symbols):
+            if profile:
+                profile.step('exact')
+            result = timed('exact', lambda: Exact(expr1, expr2, symbols).compare(test_value_sets))
+            return _outcome(result, 'exact', timings)
 
-        result = self.compare_with_impl(impl, symbols, test_value_sets)
-
-        if result == None:
-            return result
+        if self.race:
+            result = timed('race', lambda: self._race(expr1, expr2, symbols, test_value_sets, on_phase))
+            return _outcome(result, 'race', timings)
 
         # Possible failures, likely do to something like numbers being too small
         # and going to zero, or a "polar_lift not defined", or just evaluates wrong.
-        # Try another way.
-        impl.do_sympy_doit_first = True
-        result2 = self.compare_with_impl(impl, symbols, test_value_sets)
+        # So a failure from one tier just moves on to the next.
+        failures = []
+        for tier in ('float', 'doit'):
+            if tier in self.tiers:
+                result = timed(tier, lambda: self._compare_with_strategy(tier, expr1, expr2, symbols, test_value_sets,
+                    on_phase, profile))
+                if result == None:
+                    return _outcome(None, tier, timings)
+                failures.append((tier, result))
+
+        # The float tiers only gave zeros or NaNs, often because values underflowed.
+        # mpmath doesn't have that problem. If they only raised instead, often
+        # because lambdify can't translate something, sympy's own evalf may work.
+        fallback = None
+        if failures and all(result.get('error') for (_, result) in failures):
+            fallback = 'mpmath'
+        elif failures and all(result.get('exception') for (_, result) in failures):
+            fallback = 'evalf'
+        if fallback in self.tiers:
+            result = timed(fallback, lambda: self._compare_with_strategy(fallback, expr1, expr2, symbols, test_value_sets,
+                on_phase, profile))
+            if result == None or not (result.get('error') or result.get('exception')):
+                return _outcome(result, fallback, timings)
+
+        if not failures:
+            result = {
+                'symbols': symbols,
+                'expr1': expr1,
+                'expr2': expr2,
+                'error': True,
+                'message': "None of the tiers " + str(self.tiers) + " could decide."
+            }
+            return _outcome(result, None, timings)
+
+        # Prefer a comparison failure over an error
+        (tier, result) = next(((tier, result) for (tier, result) in failures if not result.get('error')), failures[0])
+        return _outcome(result, tier, timings)
+
+    def _compare_with_strategy(self, strategy, expr1, expr2, symbols, test_value_sets, on_phase, profile):
+        impl = make_backend(strategy, expr1, expr2, symbols, self.convert_exceptions, self.joint_cse)
+        impl.on_phase = on_phase
+        if profile:
+            profile.count('backend_passes')
+        return self.compare_with_impl(impl, symbols, test_value_sets, profile)
+
+    def _race(self, expr1, expr2, symbols, test_value_sets, on_phase):
+        """
+        Run each strategy in its own child process, and take the first success.
+
+        Values that differ aren't final, as another strategy may still succeed, as
+        when the strategies run one after the other. So without a success, the
+        race runs until every strategy finishes or hard_time_limit runs out, and
+        then a comparison failure is preferred over a timeout or an error.
+        """
+        strategies = ['direct', 'doit']
+        if self.race_mpmath:
+            strategies.append('mpmath')
+        settings = self._child_settings()
+        jobs = [(_race_job, (settings, strategy, expr1, expr2, symbols, test_value_sets))
+            for strategy in strategies]
+
+        (messages, phases) = race(jobs, _passed, self.hard_time_limit, on_phase)
 
-        if result2 == None:
+        if ('result', None) in messages:
             return None
+        for message in messages:
+            if message != None and message[0] == 'result' and not message[1].get('error'):
+                return message[1]
+        if None in messages:
+            phase = phases[messages.index(None)]
+            result = self._timeout_result(expr1, expr2, symbols, phase)
+            result['phases'] = dict(zip(strategies, phases))
+            return result
+        for (kind, value) in messages:
+            if kind == 'exception':
+                return self._exception_result(expr1, expr2, symbols, value)
+        return _prefer_comparison_failure([value for (kind, value) in messages])
 
-        # Prefer to return a comparison failure rather than an error
-        if result.get('error') and not result2.get('error'):
-            return result2
-        
-        return result
+    def _compare_with_deadline(self, expr1, expr2, symbols):
+        (kind, value) = run_with_deadline(_deadline_job, (self._child_settings(), expr1, expr2, symbols),
+            self.hard_time_limit, self.on_phase)
+        if kind == 'result':
+            return value
+        if kind == 'exception':
+            return _outcome(self._exception_result(expr1, expr2, symbols, value), None, {})
+        return _outcome(self._timeout_result(expr1, expr2, symbols, value), None, {})
+
+    def _exception_result(self, expr1, expr2, symbols, exception):
+        """
+        Report an exception raised outside the backends, as in a child process
+        """
+        if not self.convert_exceptions:
+            raise exception
+        return {
+            'symbols': symbols,
+            'expr1': expr1,
+            'expr2': expr2,
+            'exception': str(exception)
+        }
+
+    def _timeout_result(self, expr1, expr2, symbols, phase):
+        return {
+            'symbols': symbols,
+            'expr1': expr1,
+            'expr2': expr2,
+            'error': True,
+            'timeout': True,
+            'phase': phase,
+            'message': "Comparison took more than " + str(self.hard_time_limit) + " seconds, during " + str(phase) + "."
+        }
+
+    def compare_with_impl(self, impl, symbols, test_value_sets, profile=None):
+        """
+        Args:
+        profile: A Profile to count the test value sets tried in
+        """
+        # Evaluating every test value set in one call is much faster when the
+        # backend can do it. Otherwise, go through them one at a time.
+        try:
+            result = impl.compare_for_symbols_with_test_value_sets(test_value_sets)
+            if profile:
+                profile.count('batch_passes')
+                profile.count('test_value_sets', len(test_value_sets))
+            return result
+        except BatchUnsupportedException:
+            pass
 
-    def compare_with_impl(self, impl, symbols, test_value_sets):
         if self.test_time_limit != None:
             start = datetime.datetime.now()
 
         for test_value_set in test_value_sets:
             if len(symbols) != len(test_value_set):
                 raise Exception("Invalid test_value_set length")
+            _check_cancelled()
             
             this_result = impl.compare_for_symbols_with_test_values(test_value_set)
+            if profile:
+                profile.count('test_value_sets')
 
             if not (this_result is None):
                 return this_result
@@ -98,29 +399,351 @@ class Compare:
         
         return None
     
+    def compare_many(self, jobs, workers=None):
+        """
+        Run compare for many jobs in a pool of worker processes.
+
+        Each job is a tuple (expr1, expr2, *symbols). Yields (index, result) pairs
+        as the jobs finish, where index is the position of the job in jobs, so the
+        results generally arrive out of order.
+
+        The workers use this instance's settings, apart from on_phase. Their profiles,
+        if profiling, are added to this instance's profile_summary.
+        If convert_exceptions is False, an exception from a job is raised here.
+
+        Args:
+        jobs: Any iterable of jobs. It is consumed lazily.
+        workers: Number of worker processes. Defaults to the number of CPUs.
+            With 1, the jobs are run one after another in this process.
+
+        Closing the generator early cancels the jobs not yet started, without
+        waiting for those already running.
+        """
+        if workers == 1:
+            for (index, job) in enumerate(jobs):
+                yield (index, self.compare(*job))
+            return
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        settings = self._worker_settings()
+        # Forking while other threads run can deadlock, as for hard_time_limit
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context())
+        # Keep only a few jobs queued per worker, so a huge jobs iterable
+        # isn't pickled up front.
+        max_pending = 2 * workers
+        pending = {}
+        try:
+            job_iter = enumerate(jobs)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    next_job = next(job_iter, None)
+                    if next_job is None:
+                        exhausted = True
+                    else:
+                        (index, job) = next_job
+                        job = tuple(job)
+                        pending[executor.submit(_compare_job, settings, job)] = (index, job)
+                if not pending:
+                    return
+                (done, _) = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (index, job) = pending.pop(future)
+                    outcome = future.result()
+                    if 'profile' in outcome:
+                        self.profile_summary.add(job[0], job[1], tuple(job[2:]), outcome['profile'])
+                    yield (index, outcome['result'])
+        finally:
+            # When the generator is closed early, or a job raised, drop the jobs
+            # still queued rather than waiting for them. Jobs already running in
+            # a worker finish in the background.
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=not pending, cancel_futures=True)
+
+    async def acompare(self, expr1, expr2, *symbols):
+        """
+        Like compare, but runs in executor, so the event loop isn't blocked.
+
+        If the calling task is cancelled, a comparison running in a thread stops
+        before its next tier or test value set. One running in a process, or in a
+        child process under hard_time_limit or race, runs to the end, though the
+        result is dropped. A comparison still waiting for the executor never starts.
+        """
+        return (await self.acompare_detailed(expr1, expr2, *symbols))['result']
+
+    async def acompare_detailed(self, expr1, expr2, *symbols):
+        """
+        Like compare_detailed, see acompare
+        """
+        outcome = await self._run_async('compare_detailed', (expr1, expr2, *symbols))
+        if self._in_processes() and 'profile' in outcome:
+            self.profile_summary.add(expr1, expr2, symbols, outcome['profile'])
+        return outcome
+
+    async def achange(self, expr, op, *symbols):
+        """
+        Like change, see acompare. op runs in executor too, so with a process
+        executor it must be picklable.
+        """
+        return await self._run_async('change', (expr, op, *symbols))
+
+    async def acompare_many(self, jobs):
+        """
+        Like compare_many, as an async generator. Yields (index, result) pairs as
+        the jobs finish, running at most max_concurrent at once in executor.
+
+        Closing the generator early cancels the jobs not yet finished.
+        """
+        async def indexed(index, job):
+            return (index, await self.acompare(*job))
+
+        tasks = [asyncio.ensure_future(indexed(index, tuple(job))) for (index, job) in enumerate(jobs)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run_async(self, method, args):
+        """
+        Call the method of this instance with the given name in executor, and wait for it
+        """
+        loop = asyncio.get_running_loop()
+        if self.max_concurrent == None:
+            limit = contextlib.nullcontext()
+        else:
+            limit = self._semaphores.get(loop)
+            if limit == None:
+                limit = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        async with limit:
+            if self._in_processes():
+                # A pending job is cancelled along with the awaiting task
+                return await loop.run_in_executor(self.executor, _method_job, self._worker_settings(), method, args)
+            cancelled = threading.Event()
+            try:
+                return await loop.run_in_executor(self.executor, _run_cancellable, cancelled, getattr(self, method), args)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+    def _in_processes(self):
+        return isinstance(self.executor, ProcessPoolExecutor)
+
+    def _worker_settings(self):
+        """
+        The constructor arguments for a copy of this instance in a worker process
+        """
+        return {
+            'test_time_limit': self.test_time_limit,
+            'convert_exceptions': self.convert_exceptions,
+            'hard_time_limit': self.hard_time_limit,
+            'race': self.race,
+            'race_mpmath': self.race_mpmath,
+            'result_cache': self.result_cache,
+            'cache_size': self.cache_size,
+            'cache_bytes': self.cache_bytes,
+            'joint_cse': self.joint_cse,
+            'tiers': self.tiers,
+            'profile': self.profile
+        }
+
+    def _child_settings(self):
+        """
+        The constructor arguments for a copy of this instance in a child process
+        that runs part of a comparison, under hard_time_limit or in a race
+        """
+        settings = self._worker_settings()
+        settings.update(hard_time_limit=None, race=False, result_cache=None)
+        return settings
+
     def change(self, expr, op, *symbols):
         """
         Apply the function op to expr, and then compare to see if the
         modified result is equivalent, substituting test values
         for the symbols
         """
+        try:
+            key = ('change', expr, op, symbols)
+            hash(key)
+        except TypeError:
+            return self._change_uncached(expr, op, symbols)
+        return self.cache.get_or_compute(key, lambda: self._change_uncached(expr, op, symbols))
+
+    def _change_uncached(self, expr, op, symbols):
         new_expr = op(expr)
         this_result = self.compare(expr, new_expr, *symbols)
         if not (this_result is None):
             return this_result
         return new_expr
 
-def replace_infinite_integrals(expr):
-    if expr.is_Atom or expr.is_Dummy:
-        return expr
-    elif isinstance(expr, Integral):
-        limit_tuple = expr.args[-1]
+def _cache_entry_size(key, value):
+    """
+    Rough size of a cache entry in bytes. The pickled size is a reasonable
+    proxy for how much memory the expressions and results hold on to.
+    """
+    try:
+        return len(pickle.dumps((key, value)))
+    except Exception:
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+def _compare_job(settings, job):
+    """
+    Entry point for compare_many worker processes
+    """
+    return Compare(**settings).compare_detailed(*job)
+
+def _method_job(settings, method, args):
+    """
+    Entry point for processes running acompare and achange
+    """
+    return getattr(Compare(**settings), method)(*args)
+
+def _run_cancellable(cancelled, fn, args):
+    """
+    Call fn(*args) in an executor thread, where _check_cancelled sees the event cancelled
+    """
+    token = _cancelled.set(cancelled)
+    try:
+        return fn(*args)
+    finally:
+        _cancelled.reset(token)
+
+def _check_cancelled():
+    cancelled = _cancelled.get()
+    if cancelled != None and cancelled.is_set():
+        raise CancelledException("The comparison was cancelled.")
+
+def make_backend(strategy, expr1, expr2, symbols, convert_exceptions, joint_cse=False):
+    """
+    The backend that evaluates expr1 and expr2 for a strategy, as Compare's tiers do
+
+    Args:
+    strategy: 'direct' or 'float' for SciPyNumPy, 'doit' for SciPyNumPy after doit(),
+        'mpmath' for Mpmath or 'evalf' for Evalf
+    """
+    significance = 10
+    if strategy == 'mpmath':
+        return backends.Mpmath(expr1, expr2, symbols, significance, convert_exceptions)
+    if strategy == 'evalf':
+        return backends.Evalf(expr1, expr2, symbols, significance, convert_exceptions)
+    impl = backends.SciPyNumPy(expr1, expr2, symbols, significance, convert_exceptions)
+    impl.do_sympy_doit_first = (strategy == 'doit')
+    impl.joint_cse = joint_cse
+    return impl
+
+def _outcome(result, tier, tier_timings):
+    """
+    The dict compare_detailed returns. A failure result records the tier too.
+    """
+    if result != None:
+        result['tier'] = tier
+        result['tier_timings'] = tier_timings
+    return {'result': result, 'tier': tier, 'tier_timings': tier_timings}
+
+def _prefer_comparison_failure(results):
+    """
+    Given the failed results of several strategies, prefer a comparison failure
+    over an error. Otherwise, take the first.
+    """
+    for result in results:
+        if not result.get('error'):
+            return result
+    return results[0]
+
+def _passed(message):
+    """
+    Whether a message from a racing strategy is a success, which ends the race
+    """
+    return message == ('result', None)
+
+def _race_job(settings, strategy, expr1, expr2, symbols, test_value_sets, on_phase):
+    """
+    Entry point for the child processes racing each other in Compare._race
+    """
+    compare = Compare(**settings)
+    impl = make_backend(strategy, expr1, expr2, symbols, compare.convert_exceptions, compare.joint_cse)
+    impl.on_phase = on_phase
+    return compare.compare_with_impl(impl, symbols, test_value_sets)
+
+def _deadline_job(settings, expr1, expr2, symbols, on_phase):
+    """
+    Entry point for the child process running a comparison under hard_time_limit
+    """
+    compare = Compare(on_phase=on_phase, **settings)
+    return compare._compare(expr1, expr2, *symbols)
+
+def _canonically_equal(expr1, expr2):
+    (expr1, expr2) = (sympify(expr1), sympify(expr2))
+    # Relations and other Booleans can't be subtracted
+    if not (isinstance(expr1, Expr) and isinstance(expr2, Expr)):
+        return False
+    difference = expr1 - expr2
+    if _expanded_terms(difference, CANONICAL_MAX_TERMS) > CANONICAL_MAX_TERMS:
+        return False
+    return expand_mul(difference) == 0
+
+def _expanded_terms(expr, limit):
+    """
+    Roughly how many terms expand_mul creates in all, across expr and the
+    subexpressions it expands inside, without expanding anything. The count of
+    each subexpression is capped just past limit.
+
+    Each Add has as many terms as its args have between them, and each Mul as
+    many as the product of its args'. Anything else is one term, though its args
+    are expanded too, and count towards the total.
+    """
+    total = 0
+
+    def terms(node, arg_terms):
+        nonlocal total
+        if not (node.is_Add or node.is_Mul):
+            return 1
+        if node.is_Add:
+            count = min(sum(arg_terms), limit + 1)
+        else:
+            count = 1
+            for arg_count in arg_terms:
+                count = min(count * arg_count, limit + 1)
+        total += count
+        return count
+
+    fold_tree(expr, terms)
+    return total
+
+def missing_symbols(expr1, expr2, symbols):
+    """
+    The free symbols of either expression that aren't in symbols, so won't get
+    test values. Integration and other bound variables don't count.
+    """
+    return (sympify(expr1).free_symbols | sympify(expr2).free_symbols) - set(symbols)
+
+def replace_infinite_integrals(expr, memo=None):
+    """
+    Replace each pair of integration limits (-oo, oo) with (-1, 1), and (oo, -oo) with (1, -1).
+
+    Every limit of every integral is replaced, including integrals within integrands.
+    A subtree that appears more than once is rewritten once. Subtrees without such
+    integrals are returned as they are, not rebuilt, so expr itself comes back
+    unchanged when there's nothing to replace.
+
+    Args:
+    memo: A dict of subtrees already rewritten. Pass the same one for expressions
+        sharing subtrees.
+    """
+    def replaced(node, args):
+        if isinstance(node, Integral):
+            args = args[:1] + list(map(_finite_limits, args[1:]))
+        return rebuild(node, args)
+
+    return fold_tree(expr, replaced, memo)
+
+def _finite_limits(limit_tuple):
+    if len(limit_tuple) == 3:
         if limit_tuple[1] == -oo and limit_tuple[2] == oo:
-            limit_tuple = (limit_tuple[0], -1, 1)
-        elif limit_tuple[1] == oo and limit_tuple[2] == -oo:
-            limit_tuple = (limit_tuple[0], 1, -1)
-        return Integral(*(expr.args[:-1]), limit_tuple)
-    else:
-        newargs = map(lambda arg: replace_infinite_integrals(arg), expr.args)
-    return expr.func(*newargs)
-    
+            return Tuple(limit_tuple[0], -1, 1)
+        if limit_tuple[1] == oo and limit_tuple[2] == -oo:
+            return Tuple(limit_tuple[0], 1, -1)
+    return limit_tuple
@@ -0,0 +1,152 @@
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+from .exception import CompareException
+
+def process_context():
+    """
+    The multiprocessing context to start child processes from.
+
+    Forking is much faster than spawning a fresh interpreter that has to import
+    sympy again, and the child inherits the compiled expression cache. But a child
+    forked while other threads are running can deadlock on a lock one of them held,
+    so then children come from a fork server instead. That only works when what
+    the child runs can be pickled.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    if 'forkserver' in methods:
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+class WorkerProcess:
+    """
+    Runs target(*args, on_phase=...) in a child process that can be killed at any time.
+
+    The child reports each phase it enters back to the parent, so the parent knows
+    what was running if it has to give up on the child.
+
+    The child is forked when this is the only thread. Otherwise it's started from
+    a fork server or a fresh interpreter, so target and args must be picklable.
+    """
+
+    def __init__(self, target, args, on_phase=None):
+        """
+        Args:
+        on_phase: Called in this process with each phase the child reports
+        """
+        self.on_phase = on_phase
+        context = process_context()
+        (self.conn, child_conn) = context.Pipe(duplex=False)
+        self.process = context.Process(target=_run_child, args=(child_conn, target, args), daemon=True)
+        self.phase = None
+        self.process.start()
+        child_conn.close()
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for the child to finish.
+
+        Returns ('result', value) or ('exception', exception) once it has finished,
+        or None if it's still running.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if not self.conn.poll(max(remaining, 0)):
+                return None
+            message = self.receive()
+            if message is not None:
+                return message
+
+    def receive(self):
+        """
+        Read one message from the child. Returns None for phase updates.
+        """
+        try:
+            (kind, value) = self.conn.recv()
+        except EOFError:
+            self.process.join()
+            return ('exception', CompareException(
+                "Comparison worker exited unexpectedly with code " + str(self.process.exitcode)))
+        if kind == 'phase':
+            self.phase = value
+            if self.on_phase:
+                self.on_phase(value)
+            return None
+        self.process.join()
+        return (kind, value)
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+def _run_child(conn, target, args):
+    def on_phase(phase):
+        conn.send(('phase', phase))
+    try:
+        message = ('result', target(*args, on_phase=on_phase))
+    except BaseException as e:
+        message = ('exception', e)
+    try:
+        conn.send(message)
+    except Exception as e:
+        # The result or exception couldn't be pickled
+        conn.send(('exception', CompareException("Couldn't return result from comparison worker: " + str(e))))
+    conn.close()
+
+def run_with_deadline(target, args, time_limit, on_phase=None):
+    """
+    Run target(*args, on_phase=...) in a child process, killing it after time_limit seconds.
+
+    Returns ('result', value), ('exception', exception), or ('timeout', phase) where
+    phase is the last phase the child reported.
+    """
+    worker = WorkerProcess(target, args, on_phase)
+    try:
+        message = worker.poll(time_limit)
+        if message is None:
+            return ('timeout', worker.phase)
+        return message
+    finally:
+        worker.terminate()
+
+def race(jobs, is_conclusive, time_limit=None, on_phase=None):
+    """
+    Run each (target, args) job in its own child process, all at once.
+
+    As soon as one job finishes with a message for which is_conclusive(message) is
+    true, the others are killed. Otherwise all the jobs run to completion, or until
+    time_limit seconds have passed.
+
+    Returns (messages, phases). messages has one entry per job, in the same order:
+    ('result', value), ('exception', exception), or None for jobs that were killed.
+    phases has the last phase each job reported.
+    """
+    workers = [WorkerProcess(target, args, on_phase) for (target, args) in jobs]
+    messages = [None] * len(workers)
+    deadline = None if time_limit == None else time.monotonic() + time_limit
+    try:
+        running = {worker.conn: i for (i, worker) in enumerate(workers)}
+        while running:
+            timeout = None if deadline == None else max(deadline - time.monotonic(), 0)
+            ready = multiprocessing.connection.wait(list(running), timeout)
+            if not ready:
+                break
+            for conn in ready:
+                i = running[conn]
+                message = workers[i].receive()
+                if message is None:
+                    continue
+                del running[conn]
+                messages[i] = message
+                if is_conclusive(message):
+                    return (messages, [worker.phase for worker in workers])
+        return (messages, [worker.phase for worker in workers])
+    finally:
+        for worker in workers:
+            worker.terminate()
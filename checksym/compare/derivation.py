@@ -0,0 +1,144 @@
+from checksym.util import build_test_value_sets
+from .compare import Compare, make_backend, replace_infinite_integrals, missing_symbols
+from .exception import BatchUnsupportedException
+from .impl import Exact
+
+class Derivation:
+    """
+    A chain of steps, each applying an op to the expression the previous step gave.
+
+    With Compare.change, each expression in the middle of a chain is evaluated
+    twice: as the new expression of one step, and as the old one of the next.
+    Here each expression is evaluated once at the test value sets, and those values
+    are kept until it has been compared with the next expression, so a chain of N
+    steps takes N+1 evaluations instead of 2N.
+
+    A step those values don't settle, because an expression can't be evaluated at all
+    the test value sets in one pass, or the values don't match, is compared again
+    with Compare.compare, which tries every tier and reports any failure in full.
+    So are steps between rational functions, which the exact tier decides cheaply.
+
+    With hard_time_limit, race, profile or result_cache set on the Compare, every
+    step goes through Compare.compare instead, so those settings apply to it. The
+    values aren't shared between steps then.
+
+    For example:
+        derivation = Derivation(expr, x, a)
+        result = derivation.run([expand, together, cancel])
+        if isinstance(result, dict):
+            print("Step", result['step'], "is broken")
+    """
+
+    def __init__(self, expr, *symbols, compare=None):
+        """
+        Args:
+        expr: The starting expression
+        symbols: The symbols to substitute test values for, as for Compare.compare
+        compare: The Compare whose settings to use. Defaults to Compare().
+        """
+        self.compare = compare if compare != None else Compare()
+        self.symbols = symbols
+        self.expressions = [expr]
+        # None for each step that matched, otherwise the failure
+        self.results = []
+        # Index of the first step that didn't match, if any
+        self.broken_step = None
+        self._test_value_sets = build_test_value_sets(*symbols)
+        # Values of the last expression, by strategy. None when it can't be evaluated
+        # in one pass.
+        self._values = {}
+        self._replace_integrals = any(map(lambda x: not x.is_real, symbols))
+        # Evaluating here bypasses these settings, which all need Compare to run the comparison
+        self._shared_values = (self.compare.hard_time_limit == None and not self.compare.race
+            and not self.compare.profile and self.compare.result_cache == None)
+        # Subtrees with their infinite integrals replaced, shared by the whole chain
+        self._replaced = {}
+
+    @property
+    def expr(self):
+        """
+        The last expression in the chain
+        """
+        return self.expressions[-1]
+
+    def apply(self, op):
+        """
+        Apply the function op to the last expression, and compare the result with it.
+
+        Returns the new expression if they match, as Compare.change does. Otherwise
+        returns the failure dict, with 'step' set to the index of the step. The new
+        expression is added to the chain either way.
+        """
+        expr = self.expr
+        new_expr = op(expr)
+        (result, new_values) = self._compare_step(expr, new_expr)
+
+        step = len(self.results)
+        self.expressions.append(new_expr)
+        self.results.append(result)
+        # Only the next step needs values, and only those of new_expr
+        self._values = new_values
+        if result != None:
+            # The result may be the one Compare.cache holds
+            result = dict(result)
+            result['step'] = step
+            if self.broken_step == None:
+                self.broken_step = step
+            return result
+        return new_expr
+
+    def run(self, ops):
+        """
+        Apply each op in turn, stopping at the first step that doesn't match.
+
+        Returns the final expression if every step matches, otherwise the failure
+        dict of the broken step, as apply does.
+        """
+        for op in ops:
+            result = self.apply(op)
+            if isinstance(result, dict):
+                return result
+        return self.expr
+
+    def _compare_step(self, expr1, expr2):
+        """
+        Returns (result, values of expr2 by strategy)
+        """
+        if not self._shared_values or missing_symbols(expr1, expr2, self.symbols):
+            # Compare reports missing symbols
+            return (self.compare.compare(expr1, expr2, *self.symbols), {})
+        if expr1 == expr2:
+            return (None, self._values)
+
+        new_values = {}
+        tiers = self.compare.tiers
+        if not ('exact' in tiers and Exact.applies(expr1, expr2, self.symbols)):
+            for strategy in ('float', 'doit'):
+                if strategy not in tiers:
+                    continue
+                expr1_values = self._evaluated(self._values, strategy, expr1)
+                expr2_values = self._evaluated(new_values, strategy, expr2)
+                if expr1_values is None or expr2_values is None:
+                    continue
+                impl = self._make_impl(strategy, expr1, expr2)
+                if impl.compare_values(self._test_value_sets, expr1_values, expr2_values) == None:
+                    return (None, new_values)
+
+        return (self.compare.compare(expr1, expr2, *self.symbols), new_values)
+
+    def _evaluated(self, values, strategy, expr):
+        if strategy not in values:
+            if self._replace_integrals:
+                # As Compare does for non-real symbols
+                expr = replace_infinite_integrals(expr, self._replaced)
+            impl = self._make_impl(strategy, expr, expr)
+            try:
+                values[strategy] = impl.evaluate_values(expr, self._test_value_sets)
+            except BatchUnsupportedException:
+                values[strategy] = None
+        return values[strategy]
+
+    def _make_impl(self, strategy, expr1, expr2):
+        impl = make_backend(strategy, expr1, expr2, self.symbols, self.compare.convert_exceptions)
+        impl.on_phase = self.compare.on_phase
+        return impl
@@ -1 +1,3 @@
-from .compare_exception import CompareException
\ No newline at end of file
+from .compare_exception import CompareException, MISSING_SYMBOLS_MESSAGE
+from .batch_unsupported_exception import BatchUnsupportedException
+from .cancelled_exception import CancelledException
@@ -0,0 +1,8 @@
+from .compare_exception import CompareException
+
+class BatchUnsupportedException(CompareException):
+    """
+    Raised when a backend can't evaluate all test value sets in one call.
+    Callers should fall back to comparing one test value set at a time.
+    """
+    pass
@@ -0,0 +1,8 @@
+from .compare_exception import CompareException
+
+class CancelledException(CompareException):
+    """
+    Raised inside a comparison run by acompare when the caller has been cancelled,
+    to stop it before the remaining tiers and test value sets.
+    """
+    pass
@@ -1,5 +1,8 @@
 from pprint import pformat
 
+# Raised when an expression still has free symbols once the test values are substituted
+MISSING_SYMBOLS_MESSAGE = "Result is still an expression. Check to be sure all free variables are passed in the compare call."
+
 class CompareException(Exception):
     def __init(self, context):
         super().__init__("MESSAGE HERE: " + pformat(context))
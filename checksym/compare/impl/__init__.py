@@ -1,3 +1,56 @@
-from .scipy_numpy import SciPyNumPy
-from .evalf import Evalf
-from .mpmath import Mpmath
\ No newline at end of file
+import importlib
+import sys
+from checksym.util import test_value_cache
+from .exact import Exact, is_rational_function
+from .lambdify_cache import compiled_cache, compile_expression
+from .doit_cache import doit_cache, cached_doit
+from .value_cache import value_cache
+
+# The numeric backends import numpy, scipy and mpmath, which take longer to load
+# than the rest of checksym. So each backend is only imported when first used.
+_backends = {
+    'SciPyNumPy': '.scipy_numpy',
+    'Evalf': '.evalf',
+    'Mpmath': '.mpmath',
+}
+
+__all__ = ['Exact', 'is_rational_function', 'compiled_cache', 'compile_expression', 'doit_cache', 'cached_doit',
+    'value_cache', 'clear_caches', 'cache_stats', *_backends]
+
+def clear_caches():
+    """
+    Empty the caches shared by every comparison in this process: compiled
+    functions, doit results, values, test values, and integrals split out of
+    expressions. Each Compare's own results are in its cache attribute.
+    """
+    for cache in _caches().values():
+        cache.clear()
+
+def cache_stats():
+    """
+    The stats() of each of the caches clear_caches empties, by name
+    """
+    return {name: cache.stats() for (name, cache) in _caches().items()}
+
+def _caches():
+    caches = {
+        'compile': compiled_cache,
+        'doit': doit_cache,
+        'value': value_cache,
+        'test_value': test_value_cache,
+    }
+    # Not imported just for this, as it loads numpy
+    quadrature = sys.modules.get(__name__ + '.quadrature')
+    if quadrature != None:
+        caches['split'] = quadrature.split_cache
+    return caches
+
+def __getattr__(name):
+    if name in _backends:
+        value = getattr(importlib.import_module(_backends[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_backends))
@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
-from checksym.util import compare_to_significance_complex
-from checksym.compare.exception import CompareException
+from checksym.util import compare_to_significance_complex, compare_to_significance_complex_array
+from checksym.compare.exception import CompareException, BatchUnsupportedException
 from pprint import pformat, pp
+import numpy
 
 class CompareBase(ABC):
 
+    # Called with the name of each phase ('doit', 'lambdify', 'evaluate') as
+    # evaluation enters it
+    on_phase = None
+
     def __init__(self, expr1, expr2, symbols, significance, convert_exceptions):
         self.expr1 = expr1
         self.expr2 = expr2
@@ -16,12 +21,7 @@ class CompareBase(ABC):
         if len(self.symbols) != len(test_value_set):
             raise Exception("Invalid test_value_set length")
         self.test_value_set = test_value_set
-        result_dict = {
-                'symbols' : self.symbols,
-                'test_value_set': self.test_value_set,
-                'expr1': self.expr1,
-                'expr2': self.expr2
-            }
+        result_dict = self._result_dict()
         try:
             (expr1_final, expr1_real, expr1_imag, expr2_final, expr2_real, expr2_imag) = self._evaluate()
         except Exception as e:
@@ -61,6 +61,83 @@ class CompareBase(ABC):
 
         return None       
 
+    def compare_for_symbols_with_test_value_sets(self, test_value_sets):
+        """
+        Compare at all the test value sets with one evaluation per expression.
+
+        Returns the result for the first failing test value set, in the same form
+        as compare_for_symbols_with_test_values, or None if they all pass.
+
+        Raises BatchUnsupportedException if the backend can't evaluate the sets
+        together, or if anything unusual happens (exceptions, infinities). The caller
+        should then compare one test value set at a time, which reports those cases
+        properly.
+        """
+        for test_value_set in test_value_sets:
+            if len(self.symbols) != len(test_value_set):
+                raise Exception("Invalid test_value_set length")
+
+        (expr1_values, expr2_values) = self._evaluate_batch(test_value_sets)
+        return self.compare_values(test_value_sets, expr1_values, expr2_values)
+
+    def compare_values(self, test_value_sets, expr1_values, expr2_values):
+        """
+        Compare values already evaluated at all the test value sets, as from
+        evaluate_values. Returns what compare_for_symbols_with_test_value_sets does.
+        """
+        zero = (expr1_values == 0) | (expr2_values == 0)
+        nan = (numpy.isnan(expr1_values.real) | numpy.isnan(expr1_values.imag)
+            | numpy.isnan(expr2_values.real) | numpy.isnan(expr2_values.imag))
+        (matches, _) = compare_to_significance_complex_array(
+            expr1_values.real, expr1_values.imag,
+            expr2_values.real, expr2_values.imag, self.significance)
+
+        failures = numpy.flatnonzero(zero | nan | ~matches)
+        if len(failures) == 0:
+            return None
+
+        i = int(failures[0])
+        self.test_value_set = test_value_sets[i]
+        result_dict = self._result_dict()
+        result_dict['expr1_final'] = expr1_values[i]
+        result_dict['expr2_final'] = expr2_values[i]
+        if zero[i]:
+            result_dict['error'] = True
+            result_dict['message'] = "Some expression evaluated to 0. This usually means values got out of supported ranges."
+        elif nan[i]:
+            result_dict['error'] = True
+            result_dict['message'] = "Some expression evaluated to NaN."
+        return result_dict
+
+    def _enter_phase(self, phase):
+        if self.on_phase:
+            self.on_phase(phase)
+
+    def _result_dict(self):
+        return {
+                'symbols' : self.symbols,
+                'test_value_set': self.test_value_set,
+                'expr1': self.expr1,
+                'expr2': self.expr2
+            }
+
+    def _evaluate_batch(self, test_value_sets):
+        """
+        Should return (expr1_values, expr2_values), complex numpy arrays with one
+        entry per test value set, or raise BatchUnsupportedException.
+        """
+        raise BatchUnsupportedException("Batch evaluation is not supported by " + type(self).__name__)
+
+    def evaluate_values(self, expr, test_value_sets):
+        """
+        Evaluate expr alone at every test value set, as the expressions are
+        evaluated for compare_for_symbols_with_test_value_sets.
+
+        Returns a complex numpy array with one entry per test value set, or raises
+        BatchUnsupportedException.
+        """
+        raise BatchUnsupportedException("Batch evaluation is not supported by " + type(self).__name__)
+
     @abstractmethod
     def _evaluate(self):
         """"
@@ -0,0 +1,19 @@
+from checksym.util import LRUCache
+
+# doit() can run symbolic integration, which is by far the most expensive
+# step of a comparison, and it doesn't depend on the test values.
+# SymPy expressions hash and compare structurally, so they make good keys.
+doit_cache = LRUCache(maxsize=256)
+
+def cached_doit(expr, on_phase=None):
+    """
+    Return expr.doit(), reusing the result from an earlier call with an equal expression.
+
+    on_phase, if given, is called with 'doit' when doit() actually has to run.
+    """
+    def compute():
+        if on_phase:
+            on_phase('doit')
+        return expr.doit()
+
+    return doit_cache.get_or_compute(expr, compute)
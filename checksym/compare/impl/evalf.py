@@ -1,22 +1,93 @@
-from checksym.util import compare_to_significance_complex
 from .compare_base import CompareBase
-from sympy import re, im
-from math import isnan
+from .scaling import scale_to_floats
+from checksym.util import compare_to_significance_complex, fold_tree
+from checksym.compare.exception import CompareException, MISSING_SYMBOLS_MESSAGE
+from sympy import Float, I, Expr, Derivative
+from sympy.concrete.expr_with_limits import ExprWithLimits
+import mpmath
 
 class Evalf(CompareBase):
+    """
+    Evaluates with sympy's own numerics, so it works for anything evalf can
+    handle, including functions lambdify can't translate.
+
+    Rather than subs, which rebuilds and re-simplifies the whole tree, the tree is
+    evaluated bottom up with the test values as Floats. Each subtree is evaluated
+    once per test value set, even if both expressions contain it.
+
+    Evaluated that way, each node only gets the fixed working precision. evalf on a
+    whole tree raises the precision of a sum whose terms cancel until enough digits
+    survive, but a node evaluated from already rounded args can't. So values that
+    come out 0 or don't match are evaluated again as whole trees before they're
+    reported.
+    """
+
+    # Decimal digits to work with beyond the significance compared to
+    guard_digits = 10
 
     def _evaluate(self):
+        dps = self.significance + self.guard_digits
+        values = {symbol: self._to_float(value, dps) for (symbol, value) in zip(self.symbols, self.test_value_set)}
+        memo = {}
+        self._enter_phase('evaluate')
+        expr1_value = self._to_mpmath(self._evaluate_tree(self.expr1, values, dps, memo))
+        expr2_value = self._to_mpmath(self._evaluate_tree(self.expr2, values, dps, memo))
+        (expr1_real, expr2_real) = scale_to_floats(expr1_value.real, expr2_value.real)
+        (expr1_imag, expr2_imag) = scale_to_floats(expr1_value.imag, expr2_value.imag)
+        if self._matches(expr1_value, expr2_value, expr1_real, expr1_imag, expr2_real, expr2_imag):
+            return (expr1_value, expr1_real, expr1_imag, expr2_value, expr2_real, expr2_imag)
+
+        exact_values = dict(zip(self.symbols, self.test_value_set))
+        expr1_value = self._to_mpmath(_evalf(self.expr1.xreplace(exact_values), dps))
+        expr2_value = self._to_mpmath(_evalf(self.expr2.xreplace(exact_values), dps))
+        (expr1_real, expr2_real) = scale_to_floats(expr1_value.real, expr2_value.real)
+        (expr1_imag, expr2_imag) = scale_to_floats(expr1_value.imag, expr2_value.imag)
+        return (expr1_value, expr1_real, expr1_imag, expr2_value, expr2_real, expr2_imag)
+
+    def _matches(self, expr1_value, expr2_value, expr1_real, expr1_imag, expr2_real, expr2_imag):
+        if self._check_for_zero(expr1_value) or self._check_for_zero(expr2_value):
+            return False
+        if self._check_for_nan(expr1_value) or self._check_for_nan(expr2_value):
+            return False
+        return compare_to_significance_complex(expr1_real, expr1_imag, expr2_real, expr2_imag, self.significance)
+
+    def _evaluate_tree(self, expr, values, dps, memo):
         """
-        Doesn't work yet
+        Evaluate expr at values, reusing the values of subtrees in memo
         """
-        full_test_values = list(zip(self.symbols, self.test_value_set))
-        expr1_evaled = self.expr1.subs(full_test_values).evalf()
-        expr2_evaled = self.expr2.subs(full_test_values).evalf()
-        return (expr1_evaled, re(expr1_evaled), im(expr1_evaled),
-                expr2_evaled, re(expr2_evaled), im(expr2_evaled))
-    
+        def evaluated(node, args):
+            if _whole(node):
+                # evalf's subs leaves integrals unevaluated, so substitute first
+                return _evalf(node.xreplace(values), dps)
+            if not node.args:
+                return _evalf(node, dps, values)
+            return _evalf(node.func(*args), dps)
+
+        return fold_tree(expr, evaluated, memo, descend=lambda node: not _whole(node))
+
+    def _to_float(self, value, dps):
+        (real, imag) = value.as_real_imag()
+        return Float(real, dps) + I*Float(imag, dps) if imag != 0 else Float(real, dps)
+
+    def _to_mpmath(self, value):
+        if value.free_symbols:
+            raise CompareException(MISSING_SYMBOLS_MESSAGE)
+        (real, imag) = value.as_real_imag()
+        return mpmath.mpc(mpmath.mpf(real.evalf()), mpmath.mpf(imag.evalf()))
+
     def _check_for_zero(self, value):
         return value == 0
-    
+
     def _check_for_nan(self, value):
-        return isnan(value)
\ No newline at end of file
+        return mpmath.isnan(value)
+
+def _whole(node):
+    # Integration and differentiation variables must stay symbols, so integrals,
+    # sums and derivatives are evaluated as a whole
+    return isinstance(node, (ExprWithLimits, Derivative))
+
+def _evalf(node, dps, values=None):
+    # Conditions in Piecewise and the like aren't Expr, and have no evalf
+    if not isinstance(node, Expr) or node.is_Number:
+        return node
+    return node.evalf(dps, subs=values)
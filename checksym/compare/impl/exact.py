@@ -0,0 +1,209 @@
+from fractions import Fraction
+from random import Random
+from functools import reduce
+from sympy import Rational, I, S
+from checksym.util import fold_tree
+
+# Exact comparison of rational functions.
+#
+# When both expressions are built only from the symbols, Gaussian rational
+# numbers, +, * and integer powers, they are equal everywhere exactly when they
+# are the same rational function. That can be decided by evaluating them modulo a
+# large prime at a few random points (Schwartz-Zippel): different rational
+# functions of modest degree agree at a random point with probability about
+# degree/PRIME. No floating point is involved, so there is no significance
+# threshold, and no values underflowing to 0.
+
+# A Mersenne prime. It is 3 mod 4, so -1 has no square root modulo it, and the
+# Gaussian integers modulo it form a field.
+PRIME = 2**61 - 1
+
+# Random points to evaluate at. Each one that agrees makes a false match about
+# PRIME/degree times less likely.
+POINTS = 4
+
+# Points land on a pole once in about PRIME/degree tries. Give up after this many.
+MAX_ATTEMPTS = 3 * POINTS
+
+class _Pole(Exception):
+    pass
+
+class _GaussianRationals:
+    """
+    Exact arithmetic on a + b*i, as pairs of Fractions
+    """
+
+    def number(self, real, imag):
+        return (Fraction(real.p, real.q), Fraction(imag.p, imag.q))
+
+    def add(self, x, y):
+        return (x[0] + y[0], x[1] + y[1])
+
+    def mul(self, x, y):
+        return (x[0]*y[0] - x[1]*y[1], x[0]*y[1] + x[1]*y[0])
+
+    def inverse(self, x):
+        norm = x[0]*x[0] + x[1]*x[1]
+        if norm == 0:
+            raise _Pole()
+        return (x[0]/norm, -x[1]/norm)
+
+class _GaussianModPrime:
+    """
+    Arithmetic on a + b*i, with a and b integers modulo PRIME
+    """
+
+    def number(self, real, imag):
+        return ((real.p * pow(real.q, -1, PRIME)) % PRIME, (imag.p * pow(imag.q, -1, PRIME)) % PRIME)
+
+    def add(self, x, y):
+        return ((x[0] + y[0]) % PRIME, (x[1] + y[1]) % PRIME)
+
+    def mul(self, x, y):
+        return ((x[0]*y[0] - x[1]*y[1]) % PRIME, (x[0]*y[1] + x[1]*y[0]) % PRIME)
+
+    def inverse(self, x):
+        norm = (x[0]*x[0] + x[1]*x[1]) % PRIME
+        if norm == 0:
+            raise _Pole()
+        norm_inverse = pow(norm, -1, PRIME)
+        return ((x[0] * norm_inverse) % PRIME, (-x[1] * norm_inverse) % PRIME)
+
+def is_rational_function(expr, symbols):
+    """
+    True if expr is built only from the given symbols, Gaussian rationals,
+    sums, products and integer powers
+    """
+    symbols = set(symbols)
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node.is_Symbol:
+            if node not in symbols:
+                return False
+        elif node.is_Rational or node is I:
+            pass
+        elif node.is_Add or node.is_Mul:
+            stack.extend(node.args)
+        elif node.is_Pow:
+            if not node.exp.is_Integer:
+                return False
+            stack.append(node.base)
+        else:
+            return False
+    return True
+
+def _evaluate(expr, field, values, memo):
+    """
+    Evaluate expr in field, with values for its symbols
+
+    Subtrees shared between expressions are evaluated once, through memo.
+    """
+    def evaluated(node, args):
+        if node.is_Symbol:
+            return values[node]
+        if node.is_Rational:
+            return field.number(node, S.Zero)
+        if node is I:
+            return field.number(S.Zero, S.One)
+        if node.is_Add:
+            return reduce(field.add, args)
+        if node.is_Mul:
+            return reduce(field.mul, args)
+        return _power(field, args[0], int(node.exp))
+
+    return fold_tree(expr, evaluated, memo)
+
+def _power(field, base, exponent):
+    if exponent < 0:
+        base = field.inverse(base)
+        exponent = -exponent
+    result = field.number(S.One, S.Zero)
+    while exponent:
+        if exponent & 1:
+            result = field.mul(result, base)
+        base = field.mul(base, base)
+        exponent >>= 1
+    return result
+
+class Exact:
+    """
+    Compares two rational functions exactly. See is_rational_function.
+    """
+
+    def __init__(self, expr1, expr2, symbols):
+        self.expr1 = expr1
+        self.expr2 = expr2
+        self.symbols = symbols
+
+    @staticmethod
+    def applies(expr1, expr2, symbols):
+        return is_rational_function(expr1, symbols) and is_rational_function(expr2, symbols)
+
+    def compare(self, test_value_sets):
+        """
+        Returns None if the expressions are the same rational function.
+
+        Otherwise, returns a result like CompareBase's for the first test value set
+        where they differ, with the exact values. If they agree at all the test value
+        sets, the result instead has 'test_value_set' set to None, and a message.
+        """
+        same = self._same_modulo_prime()
+        if same:
+            return None
+        if same == None:
+            result_dict = self._result_dict(None)
+            result_dict['error'] = True
+            result_dict['message'] = "Some expression divides by zero for all values."
+            return result_dict
+
+        field = _GaussianRationals()
+        for test_value_set in test_value_sets:
+            values = {symbol: field.number(*S(value).as_real_imag()) for (symbol, value) in zip(self.symbols, test_value_set)}
+            memo = {}
+            try:
+                expr1_value = _evaluate(self.expr1, field, values, memo)
+                expr2_value = _evaluate(self.expr2, field, values, memo)
+            except _Pole:
+                continue
+            if expr1_value != expr2_value:
+                result_dict = self._result_dict(test_value_set)
+                result_dict['expr1_final'] = _to_sympy(expr1_value)
+                result_dict['expr2_final'] = _to_sympy(expr2_value)
+                return result_dict
+
+        result_dict = self._result_dict(None)
+        result_dict['message'] = "The expressions agree at the test values, but are different rational functions."
+        return result_dict
+
+    def _same_modulo_prime(self):
+        """
+        True or False, or None if every point tried was a pole
+        """
+        field = _GaussianModPrime()
+        # Seeded, so a comparison always gives the same answer
+        random = Random(0)
+        agreed = 0
+        for _ in range(MAX_ATTEMPTS):
+            values = {symbol: (random.randrange(PRIME), random.randrange(PRIME)) for symbol in self.symbols}
+            memo = {}
+            try:
+                if _evaluate(self.expr1, field, values, memo) != _evaluate(self.expr2, field, values, memo):
+                    return False
+            except _Pole:
+                continue
+            agreed += 1
+            if agreed == POINTS:
+                return True
+        return None
+
+    def _result_dict(self, test_value_set):
+        return {
+            'symbols': self.symbols,
+            'test_value_set': test_value_set,
+            'expr1': self.expr1,
+            'expr2': self.expr2
+        }
+
+def _to_sympy(value):
+    return Rational(value[0]) + I*Rational(value[1])
@@ -0,0 +1,48 @@
+from sympy import lambdify, Integral
+from sympy.simplify.cse_main import cse as sympy_cse
+from checksym.util import LRUCache
+from .doit_cache import cached_doit
+
+# Generating and exec'ing the lambdify source dominates the cost of a
+# numeric check, and the result depends only on the expression, not on
+# the test values. So compile each expression once per process.
+compiled_cache = LRUCache(maxsize=512)
+
+def compile_expression(expr, symbols, modules, doit=False, on_phase=None, cse=False):
+    """
+    Return lambdify(symbols, expr, modules), reusing an earlier compilation when possible.
+
+    If doit is set, the function is built for expr.doit(). When doit() leaves the
+    expression unchanged, the function compiled for the plain expression is reused.
+
+    on_phase, if given, is called with 'doit' or 'lambdify' before that work starts.
+    Nothing is reported when the function comes from the cache.
+
+    If cse is set, repeated subexpressions are computed once in the generated
+    function. This is worthwhile for a Tuple of expressions sharing subtrees.
+    """
+    key = (expr, tuple(symbols), tuple(modules), doit, cse)
+
+    def compute():
+        if doit:
+            return compile_expression(cached_doit(expr, on_phase), symbols, modules, on_phase=on_phase, cse=cse)
+        if on_phase:
+            on_phase('lambdify')
+        if cse:
+            return lambdify(symbols, expr, modules, cse=_cse_outside_integrals)
+        return lambdify(symbols, expr, modules)
+
+    return compiled_cache.get_or_compute(key, compute)
+
+def _cse_outside_integrals(expr):
+    """
+    Common subexpression elimination that leaves integrands alone.
+
+    A subexpression of an integrand that contains the integration variable can't be
+    computed outside the integral, so those are ignored. Whole integrals can still be
+    shared.
+    """
+    bound = set()
+    for integral in expr.atoms(Integral):
+        bound.update(integral.variables)
+    return sympy_cse(expr, ignore=bound, list=False)
@@ -1,31 +1,95 @@
+from types import FunctionType
 from checksym.util import compare_to_significance_complex
 from .compare_base import CompareBase
-from sympy import re, im
-from math import isnan
+from .scaling import scale_to_floats
 import mpmath
-from sympy import lambdify
+from sympy.utilities.lambdify import MPMATH_TRANSLATIONS
+from .lambdify_cache import compile_expression
 
 class Mpmath(CompareBase):
+    """
+    Evaluates with mpmath, at increasing precision where needed.
+
+    Slower than SciPyNumPy, but values far outside the range of floats, like the
+    integral of a Gaussian of width hbar, don't underflow to 0.
+    """
+
+    # Decimal digits to work with beyond the significance compared to
+    guard_digits = 5
+
+    # Decimal digits to retry with, in turn, for a test value set whose values
+    # come out as 0, or disagree only in their last few digits, at the starting
+    # precision
+    escalation_dps = (30, 60, 120)
+
+    # How many digits short of the significance the values must agree to for
+    # more precision to be worth trying. Values that differ before that won't
+    # come to agree from rounding alone.
+    near_miss_digits = 3
 
     def _evaluate(self):
+        lambdify_modules = ['mpmath']
+        expr1_fn = compile_expression(self.expr1, self.symbols, lambdify_modules, True, self.on_phase)
+        expr2_fn = compile_expression(self.expr2, self.symbols, lambdify_modules, True, self.on_phase)
+        self._enter_phase('evaluate')
+
+        # A context of our own, rather than mpmath.workdps, so the precision of
+        # the global context, which other threads may be using, is left alone
+        ctx = mpmath.mp.clone()
+        expr1_fn = _in_context(expr1_fn, ctx)
+        expr2_fn = _in_context(expr2_fn, ctx)
+
+        start_dps = self.significance + self.guard_digits
+        for dps in (start_dps, *(dps for dps in self.escalation_dps if dps > start_dps)):
+            ctx.dps = dps
+            test_value_set_for_lambdify = [self.cleanup_for_lambdify(value, dps, ctx) for value in self.test_value_set]
+            expr1_value = ctx.convert(expr1_fn(*test_value_set_for_lambdify))
+            expr2_value = ctx.convert(expr2_fn(*test_value_set_for_lambdify))
+            (expr1_real, expr2_real) = scale_to_floats(expr1_value.real, expr2_value.real)
+            (expr1_imag, expr2_imag) = scale_to_floats(expr1_value.imag, expr2_value.imag)
+            if self._is_settled(expr1_value, expr2_value, expr1_real, expr1_imag, expr2_real, expr2_imag):
+                break
+
+        return (expr1_value, expr1_real, expr1_imag, expr2_value, expr2_real, expr2_imag)
+
+    def _is_settled(self, expr1_value, expr2_value, expr1_real, expr1_imag, expr2_real, expr2_imag):
         """
-        Doesn't work yet
+        False if more precision might change the outcome of the comparison
         """
-        expr1_evaled = self.expr1.doit()
-        expr2_evaled = self.expr2.doit()
-        lambdify_modules = ['mpmath']
-        test_value_set_for_lambdify = list(map(self.cleanup_for_lambdify, self.test_value_set))
-        this_expr1_lambdify_evaled = lambdify(self.symbols, expr1_evaled, lambdify_modules)(*test_value_set_for_lambdify)
-        this_expr2_lambdify_evaled = lambdify(self.symbols, expr2_evaled, lambdify_modules)(*test_value_set_for_lambdify)
-        return (this_expr1_lambdify_evaled, this_expr1_lambdify_evaled.real, this_expr1_lambdify_evaled.imag,
-            this_expr2_lambdify_evaled, this_expr2_lambdify_evaled.real, this_expr1_lambdify_evaled.imag)
-    
-    def cleanup_for_lambdify(self, expr):
+        if self._check_for_zero(expr1_value) or self._check_for_zero(expr2_value):
+            return False
+        if self._check_for_nan(expr1_value) or self._check_for_nan(expr2_value):
+            return True
+        if compare_to_significance_complex(expr1_real, expr1_imag, expr2_real, expr2_imag, self.significance):
+            return True
+        near_miss = max(self.significance - self.near_miss_digits, 1)
+        return not compare_to_significance_complex(expr1_real, expr1_imag, expr2_real, expr2_imag, near_miss)
+
+    def cleanup_for_lambdify(self, expr, dps=15, ctx=mpmath.mp):
         real_imag = expr.as_real_imag()
-        return float(real_imag[0]) + 1j * float(real_imag[1])
-    
+        return ctx.mpc(ctx.mpf(real_imag[0].evalf(dps)), ctx.mpf(real_imag[1].evalf(dps)))
+
     def _check_for_zero(self, value):
         return value == 0
-    
+
     def _check_for_nan(self, value):
-        return False
\ No newline at end of file
+        return mpmath.isnan(value)
+
+def _in_context(fn, ctx):
+    """
+    fn, as compiled by lambdify for the 'mpmath' module, with the mpmath names it
+    uses bound to ctx instead of the global context.
+
+    lambdify's namespace holds the global context's functions, types and constants,
+    which all work at the global precision. The compiled code is reused as it is,
+    and nested functions (like the integrands passed to quad) pick up the new
+    namespace too.
+    """
+    namespace = dict(fn.__globals__)
+    for (name, value) in fn.__globals__.items():
+        # Implemented functions can share a name with an mpmath one, so only
+        # rebind what is still the mpmath module's own
+        source = MPMATH_TRANSLATIONS.get(name, name)
+        if not name.startswith('_') and hasattr(ctx, source) and getattr(mpmath, source, None) is value:
+            namespace[name] = getattr(ctx, source)
+    return FunctionType(fn.__code__, namespace, fn.__name__, fn.__defaults__, fn.__closure__)
@@ -0,0 +1,343 @@
+from functools import lru_cache
+from math import pi
+import numpy
+from sympy import Integral, Dummy, S, preorder_traversal
+from checksym.util import LRUCache
+from checksym.compare.exception import BatchUnsupportedException
+from .lambdify_cache import compile_expression
+
+# Numeric integration for all test value sets at once.
+#
+# lambdify turns an Integral into scipy's adaptive quad, which integrates one
+# scalar point at a time. Here the integrand is instead evaluated on a fixed set
+# of nodes for every test value set in a single numpy call, and the rule is
+# refined until two successive levels agree. Levels that agree because the
+# integrand is zero at all their nodes don't count, since a peak narrower than
+# the gaps between nodes would give exactly that. Finite intervals use
+# Gauss-Legendre. Infinite ones use double exponential (sinh-sinh and exp-sinh) rules, which
+# cope with the slowly decaying and complex integrands we get here far better
+# than Gauss-Hermite would.
+#
+# Anything that doesn't converge raises BatchUnsupportedException, so the caller
+# falls back to quad.
+
+LAMBDIFY_MODULES = ['scipy', 'numpy']
+
+# Relative agreement required between two successive levels. Both rules converge
+# very quickly once they start to, so the finer level is far more accurate than this.
+TOLERANCE = 1e-12
+
+# Allowance for cancellation, relative to the integral of the absolute value
+CANCELLATION_TOLERANCE = 1e-14
+
+GAUSS_LEGENDRE_MAX_LEVEL = 5
+DOUBLE_EXPONENTIAL_MAX_LEVEL = 7
+
+# Largest grid of test value sets and nodes to evaluate an integrand on in one go.
+# Each level of nesting multiplies the grid by its number of nodes.
+MAX_GRID_SIZE = 2 ** 22
+
+# The double exponential rules run over t in [-4, 4]. x reaches about 1e18 at the
+# ends, which is far enough for any integrand that decays at least like 1/x**2.
+DOUBLE_EXPONENTIAL_RANGE = 4
+
+# Nodes whose terms are smaller than this, relative to the integral of the absolute
+# value, are trimmed from the double exponential range. Most integrands here decay
+# far faster than the rules assume, so this saves many nodes, which matters most
+# for nested integrals.
+NEGLIGIBLE = 1e-18
+
+@lru_cache(maxsize=None)
+def _gauss_legendre(level):
+    """
+    Nodes and weights on [-1, 1]
+    """
+    (nodes, weights) = numpy.polynomial.legendre.leggauss(16 * 2 ** level)
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return (nodes, weights)
+
+@lru_cache(maxsize=None)
+def _double_exponential(level, kind, t_range):
+    """
+    Nodes and weights on (-oo, oo) for 'sinh-sinh', or on (0, oo) for 'exp-sinh',
+    and the values of t they come from.
+
+    t_range is a pair of integers. The step is 2 ** -level, so each level has all
+    the nodes of the level before.
+    """
+    h = 2.0 ** -level
+    t = numpy.arange(t_range[0], t_range[1] + h / 2, h)
+    u = pi / 2 * numpy.sinh(t)
+    if kind == 'sinh-sinh':
+        nodes = numpy.sinh(u)
+        weights = h * pi / 2 * numpy.cosh(t) * numpy.cosh(u)
+    else:
+        nodes = numpy.exp(u)
+        weights = h * pi / 2 * numpy.cosh(t) * nodes
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    t.flags.writeable = False
+    return (nodes, weights, t)
+
+_FULL_RANGE = (-DOUBLE_EXPONENTIAL_RANGE, DOUBLE_EXPONENTIAL_RANGE)
+
+class _Limits:
+    """
+    The integration range for every test value set, and the rule that covers it
+    """
+
+    def __init__(self, lower, upper, args, values, shape):
+        self.lower = lower
+        self.upper = upper
+        self.lower_infinite = lower in (S.Infinity, S.NegativeInfinity)
+        self.upper_infinite = upper in (S.Infinity, S.NegativeInfinity)
+        self.lower_values = None if self.lower_infinite else _limit_values(lower, args, values, shape)
+        self.upper_values = None if self.upper_infinite else _limit_values(upper, args, values, shape)
+        if self.lower_infinite and self.upper_infinite and lower == upper:
+            raise BatchUnsupportedException("Integral limits are the same infinity")
+        self.infinite = self.lower_infinite or self.upper_infinite
+        self.max_level = DOUBLE_EXPONENTIAL_MAX_LEVEL if self.infinite else GAUSS_LEGENDRE_MAX_LEVEL
+
+    def nodes(self, level, t_range=_FULL_RANGE):
+        """
+        Return (nodes, weights), with a trailing axis for the nodes
+
+        t_range only applies to the double exponential rules.
+        """
+        if not self.infinite:
+            (nodes, weights) = _gauss_legendre(level)
+            half = ((self.upper_values - self.lower_values) / 2)[..., None]
+            middle = ((self.upper_values + self.lower_values) / 2)[..., None]
+            return (middle + half * nodes, half * weights)
+
+        if self.lower_infinite and self.upper_infinite:
+            (nodes, weights, _) = _double_exponential(level, 'sinh-sinh', t_range)
+            sign = 1 if self.upper == S.Infinity else -1
+            return (nodes, sign * weights)
+
+        (nodes, weights, _) = _double_exponential(level, 'exp-sinh', t_range)
+        if self.upper == S.Infinity:
+            return (self.lower_values[..., None] + nodes, weights)
+        if self.lower == S.NegativeInfinity:
+            return (self.upper_values[..., None] - nodes, weights)
+        if self.lower == S.Infinity:
+            return (self.upper_values[..., None] + nodes, -weights)
+        return (self.lower_values[..., None] - nodes, -weights)
+
+def _limit_values(limit, args, values, shape):
+    if limit.has(S.Infinity, S.NegativeInfinity, S.ComplexInfinity):
+        raise BatchUnsupportedException("Unsupported integral limit " + str(limit))
+    limit_values = compile_expression(limit, args, LAMBDIFY_MODULES)(*values)
+    limit_values = numpy.broadcast_to(numpy.asarray(limit_values, dtype=complex), shape)
+    if not numpy.isfinite(limit_values).all() or (limit_values.imag != 0).any():
+        raise BatchUnsupportedException("Integral limits must be real")
+    return limit_values.real
+
+class _ExpressionPlan:
+    """
+    An expression compiled for the given args, with a plan for each of its integrals
+
+    nested is set for the integrand of another integral.
+    """
+
+    def __init__(self, expr, args, on_phase=None, cse=False, nested=False):
+        (outer, integrals, placeholders) = _split_integrals(expr)
+        self.fn = compile_expression(outer, (*args, *placeholders), LAMBDIFY_MODULES, on_phase=on_phase, cse=cse)
+        self.integrals = [_IntegralPlan(integral, args, on_phase, nested) for integral in integrals]
+
+    def evaluate(self, values):
+        integral_values = [plan.integrate(values)[0] for plan in self.integrals]
+        return self.fn(*values, *integral_values)
+
+class _IntegralPlan:
+    """
+    An integral, with its integrand and limits compiled for the given args
+
+    An integral over several variables is integrated as nested integrals, innermost
+    (first) limit first, since the inner limits may depend on the outer variables.
+    Nested integrals are planned recursively, with the outer integration variables
+    as extra args, so the nodes of each level add an axis to the grid: a tensor
+    product rule.
+    """
+
+    def __init__(self, integral, args, on_phase=None, nested=False):
+        if any(len(limit) != 3 for limit in integral.limits):
+            raise BatchUnsupportedException("Only definite integrals are supported")
+        (x, lower, upper) = integral.limits[-1]
+        if x in args:
+            raise BatchUnsupportedException("Integration variable is also a free symbol")
+        if len(integral.limits) > 1:
+            integrand = Integral(integral.function, *integral.limits[:-1])
+        else:
+            integrand = integral.function
+        self.lower = lower
+        self.upper = upper
+        self.args = args
+        self.integrand = _ExpressionPlan(integrand, (*args, x), on_phase, nested=True)
+        # An inner integral is legitimately zero at every node where the outer
+        # integrand has died away, so only the outermost integral checks that
+        # the integrand was sampled at all
+        self.nested = nested
+        for limit in (lower, upper):
+            if limit not in (S.Infinity, S.NegativeInfinity):
+                compile_expression(limit, args, LAMBDIFY_MODULES, on_phase=on_phase)
+        # Once an integral has converged at some level, later calls (for instance
+        # for the next outer node of a nested integral) start from there, and
+        # with the same trimmed range.
+        self.start_level = 0
+        self.t_range = _FULL_RANGE
+
+    def integrate(self, values):
+        shape = numpy.broadcast_shapes(*(numpy.shape(value) for value in values))
+        limits = _Limits(self.lower, self.upper, self.args, values, shape)
+        values_with_node_axis = [numpy.asarray(value)[..., None] for value in values]
+        if limits.infinite:
+            return self._integrate_double_exponential(limits, values_with_node_axis, shape)
+        return self._integrate_gauss_legendre(limits, values_with_node_axis, shape)
+
+    def _terms(self, limits, level, values_with_node_axis, shape, t_range=_FULL_RANGE):
+        (nodes, weights) = limits.nodes(level, t_range)
+        grid_shape = shape + (numpy.shape(nodes)[-1],)
+        if numpy.prod(grid_shape) > MAX_GRID_SIZE:
+            raise BatchUnsupportedException("Numeric integration needs too many nodes")
+        integrand = self.integrand.evaluate([*values_with_node_axis, nodes])
+        integrand = numpy.broadcast_to(numpy.asarray(integrand, dtype=complex), grid_shape)
+        terms = integrand * weights
+        if not numpy.isfinite(terms).all():
+            raise BatchUnsupportedException("Integrand is not finite at some nodes")
+        return (terms, (integrand != 0).any(axis=-1))
+
+    def _check_sampled(self, sampled):
+        """
+        Two levels that agree only because the integrand is zero at every node of
+        both, as when a narrow peak falls between the nodes, prove nothing.
+        """
+        if not self.nested and not sampled.all():
+            raise BatchUnsupportedException("Integrand is zero at every node")
+
+    def _integrate_gauss_legendre(self, limits, values_with_node_axis, shape):
+        previous = None
+        for level in range(self.start_level, limits.max_level + 1):
+            (terms, sampled) = self._terms(limits, level, values_with_node_axis, shape)
+            result = terms.sum(axis=-1)
+            if previous is not None:
+                error = numpy.abs(result - previous)
+                noise = CANCELLATION_TOLERANCE * numpy.abs(terms).sum(axis=-1)
+                if (error <= TOLERANCE * numpy.abs(result) + noise).all():
+                    self._check_sampled(sampled)
+                    self.start_level = level - 1
+                    return (_snap_to_zero(result, noise), error)
+            previous = result
+
+        raise BatchUnsupportedException("Numeric integration did not converge")
+
+    def _integrate_double_exponential(self, limits, values_with_node_axis, shape):
+        kind = 'sinh-sinh' if limits.lower_infinite and limits.upper_infinite else 'exp-sinh'
+        level = max(self.start_level, 1)
+        while level <= limits.max_level:
+            (terms, sampled) = self._terms(limits, level, values_with_node_axis, shape, self.t_range)
+            result = terms.sum(axis=-1)
+            # The previous level's nodes are every other node here, with twice the weight
+            previous = 2 * terms[..., ::2].sum(axis=-1)
+            noise = CANCELLATION_TOLERANCE * numpy.abs(terms).sum(axis=-1)
+            allowed = TOLERANCE * numpy.abs(result) + noise
+
+            # The integrand must have died away at the ends of the range, or the
+            # truncated tails could matter
+            tails = numpy.abs(terms[..., 0]) + numpy.abs(terms[..., -1])
+            if (tails > allowed).any() and self.t_range != _FULL_RANGE:
+                # A range trimmed for other values is too narrow for these
+                self.t_range = _FULL_RANGE
+                continue
+
+            error = numpy.abs(result - previous) + tails
+            self.t_range = self._trimmed_range(terms, _double_exponential(level, kind, self.t_range)[2])
+            if (error <= allowed).all():
+                self._check_sampled(sampled)
+                self.start_level = level
+                return (_snap_to_zero(result, noise), error)
+            level += 1
+
+        raise BatchUnsupportedException("Numeric integration did not converge")
+
+    def _trimmed_range(self, terms, t):
+        """
+        The smallest range of integer t that covers every term that matters
+        """
+        magnitude = numpy.abs(terms)
+        relative = magnitude / numpy.maximum(magnitude.sum(axis=-1, keepdims=True), numpy.finfo(float).tiny)
+        relative = relative.reshape(-1, len(t)).max(axis=0)
+        significant = numpy.flatnonzero(relative > NEGLIGIBLE)
+        if len(significant) == 0:
+            return self.t_range
+        lower = max(int(numpy.floor(t[significant[0]])), -DOUBLE_EXPONENTIAL_RANGE)
+        upper = min(int(numpy.ceil(t[significant[-1]])), DOUBLE_EXPONENTIAL_RANGE)
+        return (lower, upper)
+
+def integrate(integral, args, values):
+    """
+    Numerically integrate for many values of the free symbols at once.
+
+    Args:
+    integral: A definite Integral. It may have several limits, and contain other integrals.
+    args: The symbols the integral depends on
+    values: One array of values for each of the args. They must broadcast together.
+
+    Returns (result, error), complex and real arrays with the broadcast shape of values.
+    error is the difference between the last two levels of the rule.
+    """
+    return _IntegralPlan(integral, args).integrate(values)
+
+def _snap_to_zero(result, noise):
+    """
+    Set real or imaginary parts that are only rounding noise to exactly zero.
+
+    A real integrand on a complex grid picks up an imaginary part of around 1e-19,
+    and compare_to_significance would treat that as different from an exact zero.
+    """
+    real = numpy.where(numpy.abs(result.real) <= noise, 0, result.real)
+    imag = numpy.where(numpy.abs(result.imag) <= noise, 0, result.imag)
+    return real + 1j * imag
+
+# Splitting an expression into its integrals and the expression around them is
+# done once per expression, so the placeholders, and so the compiled functions,
+# are reused.
+split_cache = LRUCache(maxsize=512)
+
+def _split_integrals(expr):
+    """
+    Return (outer, integrals, placeholders), where outer is expr with each outermost
+    integral replaced by a placeholder symbol
+    """
+    def compute():
+        integrals = []
+        traversal = preorder_traversal(expr)
+        for node in traversal:
+            if isinstance(node, Integral):
+                if node not in integrals:
+                    integrals.append(node)
+                traversal.skip()
+        placeholders = [Dummy('integral') for _ in integrals]
+        outer = expr.xreplace(dict(zip(integrals, placeholders)))
+        return (outer, integrals, placeholders)
+
+    return split_cache.get_or_compute(expr, compute)
+
+def evaluate(expr, args, values, on_phase=None, cse=False):
+    """
+    Evaluate expr for many values of args at once, integrating any integrals numerically.
+
+    expr may be a Tuple, to evaluate several expressions together. Each distinct
+    integral is then integrated once, however many of them it appears in, and with
+    cse set the rest of their shared subexpressions are computed once too.
+
+    on_phase, if given, is called with 'lambdify' when compiling, and with 'evaluate'
+    once everything is compiled.
+
+    Raises BatchUnsupportedException for integrals that can't be handled here.
+    """
+    plan = _ExpressionPlan(expr, args, on_phase, cse)
+    if on_phase:
+        on_phase('evaluate')
+    return plan.evaluate(values)
@@ -0,0 +1,18 @@
+import mpmath
+
+# The Mpmath and Evalf backends both get values that may be far outside the range
+# of floats, and compare them with compare_to_significance_complex, which takes floats.
+
+def scale_to_floats(a, b):
+    """
+    Scale a and b by the same power of 10, so the larger is of order one, and
+    convert them to floats.
+
+    The comparison only depends on their ratio and signs, which this keeps, unless
+    one is so much smaller than the other that it becomes 0, when they differ anyway.
+    """
+    largest = max(abs(a), abs(b))
+    if largest == 0 or not mpmath.isfinite(largest):
+        return (float(a), float(b))
+    scale = mpmath.power(10, -mpmath.floor(mpmath.log10(largest)))
+    return (float(a * scale), float(b * scale))
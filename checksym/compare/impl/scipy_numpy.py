@@ -1,47 +1,141 @@
-from sympy import lambdify, Expr
+from sympy import Expr, Tuple
 from .compare_base import CompareBase
-from checksym.compare.exception import CompareException
+from .lambdify_cache import compile_expression
+from .doit_cache import cached_doit
+from .value_cache import value_cache, value_key
+from . import quadrature
+from checksym.compare.exception import CompareException, BatchUnsupportedException, MISSING_SYMBOLS_MESSAGE
+from checksym.util import LRUCache, as_test_value_array
 from math import isnan
 from pprint import pp
 from numpy import ndarray, ComplexWarning
+import numpy
 from warnings import catch_warnings, filterwarnings
 
+# The same few test values come up in every comparison
+_complex_values = LRUCache(maxsize=1024)
+
 class SciPyNumPy(CompareBase):
 
     do_sympy_doit_first = False
 
+    # Compile both expressions into one function that computes their common
+    # subexpressions, integrals in particular, only once. Worthwhile when expr2
+    # is a rewrite of expr1, as with Compare.change.
+    joint_cse = False
+
     def _evaluate(self):
+        # Values already computed for either expression at this test value set are reused
+        exprs = (self.expr1, self.expr2)
+        keys = [self._value_key(expr, tuple(self.test_value_set)) for expr in exprs]
+        values = [value_cache.get(key) for key in keys]
+        missing = [i for (i, value) in enumerate(values) if value is None]
 
-        # Without the 'doit()' here, test_integrate_small_value_ensure_non_zero will fail
-        if self.do_sympy_doit_first:
-            expr1 = self.expr1.doit()
-            expr2 = self.expr2.doit()
+        lambdify_modules = ['scipy', 'numpy']
+        if self.joint_cse and len(missing) == 2:
+            joint_fn = compile_expression(Tuple(*self._exprs()), self.symbols, lambdify_modules, on_phase=self.on_phase, cse=True)
         else:
-            expr1 = self.expr1
-            expr2 = self.expr2
+            # Without the 'doit()' here, test_integrate_small_value_ensure_non_zero will fail
+            fns = {i: compile_expression(exprs[i], self.symbols, lambdify_modules, self.do_sympy_doit_first, self.on_phase)
+                for i in missing}
 
-        lambdify_modules = ['scipy', 'numpy']
-        test_value_set_for_lambdify = list(map(self.cleanup_for_lambdify, self.test_value_set))
-
-        with catch_warnings():
-            filterwarnings('ignore', category=ComplexWarning)
-            this_expr1_lambdify_evaled = lambdify(self.symbols, expr1, lambdify_modules)(*test_value_set_for_lambdify)
-            this_expr2_lambdify_evaled = lambdify(self.symbols, expr2, lambdify_modules)(*test_value_set_for_lambdify)
-        
-        this_expr1_lambdify_evaled = self._cleanup_result(this_expr1_lambdify_evaled)
-        this_expr2_lambdify_evaled = self._cleanup_result(this_expr2_lambdify_evaled)
-        
+        if missing:
+            test_value_set_for_lambdify = list(map(self.cleanup_for_lambdify, self.test_value_set))
+
+            self._enter_phase('evaluate')
+            with catch_warnings():
+                filterwarnings('ignore', category=ComplexWarning)
+                if self.joint_cse and len(missing) == 2:
+                    evaluated = joint_fn(*test_value_set_for_lambdify)
+                else:
+                    evaluated = [fns[i](*test_value_set_for_lambdify) for i in missing]
+
+            for (i, value) in zip(missing, evaluated):
+                values[i] = self._cleanup_result(value)
+                value_cache.put(keys[i], values[i])
+
+        (this_expr1_lambdify_evaled, this_expr2_lambdify_evaled) = values
         return (this_expr1_lambdify_evaled, this_expr1_lambdify_evaled.real, this_expr1_lambdify_evaled.imag,
-            this_expr2_lambdify_evaled, this_expr2_lambdify_evaled.real, this_expr1_lambdify_evaled.imag)
+            this_expr2_lambdify_evaled, this_expr2_lambdify_evaled.real, this_expr2_lambdify_evaled.imag)
+
+    def _evaluate_batch(self, test_value_sets):
+        """
+        Evaluate each expression at every test value set with a single call, passing
+        one complex array per symbol.
+
+        Integrals are integrated numerically for all the test value sets at once
+        too. Those that don't converge that way are left to scipy's quad, on the
+        one-at-a-time path.
+        """
+        return self._cached_values((self.expr1, self.expr2), test_value_sets)
+
+    def evaluate_values(self, expr, test_value_sets):
+        return self._cached_values((expr,), test_value_sets)[0]
+
+    def _cached_values(self, exprs, test_value_sets):
+        """
+        The values of each of exprs at all the test value sets, evaluating only
+        those not in value_cache
+        """
+        points = tuple(map(tuple, test_value_sets))
+        keys = [self._value_key(expr, points) for expr in exprs]
+        values = [value_cache.get(key) for key in keys]
+        missing = [i for (i, value) in enumerate(values) if value is None]
+        if missing:
+            prepared = [exprs[i] for i in missing]
+            if self.do_sympy_doit_first:
+                prepared = [cached_doit(expr, self.on_phase) for expr in prepared]
+            evaluated = self._evaluate_exprs(prepared, test_value_sets, self.joint_cse and len(missing) > 1)
+            for (i, value) in zip(missing, evaluated):
+                # Shared through the cache from now on
+                value.flags.writeable = False
+                values[i] = value
+                value_cache.put(keys[i], value)
+        return tuple(values)
+
+    def _value_key(self, expr, points):
+        return value_key(type(self).__name__, self.do_sympy_doit_first, expr, self.symbols, points)
+
+    def _evaluate_exprs(self, exprs, test_value_sets, joint_cse):
+        # Built from the very sets the values are cached under, and only once for them
+        columns = as_test_value_array(test_value_sets).T
+
+        results = []
+        try:
+            with catch_warnings(), numpy.errstate(all='ignore'):
+                filterwarnings('ignore', category=ComplexWarning)
+                if joint_cse:
+                    evaluated = quadrature.evaluate(Tuple(*exprs), self.symbols, list(columns), self.on_phase, cse=True)
+                else:
+                    evaluated = [quadrature.evaluate(expr, self.symbols, list(columns), self.on_phase) for expr in exprs]
+                for values in evaluated:
+                    values = numpy.broadcast_to(numpy.asarray(values, dtype=complex), (len(test_value_sets),))
+                    results.append(values)
+        except BatchUnsupportedException:
+            raise
+        except Exception as e:
+            raise BatchUnsupportedException("Batch evaluation failed: " + str(e)) from e
+
+        # Overflow and division by zero give infinities here, where the scalar path
+        # may raise instead. Let that path decide what to report.
+        if not all(numpy.isfinite(values).all() for values in results):
+            raise BatchUnsupportedException("Batch evaluation gave non-finite values")
+
+        return tuple(results)
+
+    def _exprs(self):
+        exprs = [self.expr1, self.expr2]
+        if self.do_sympy_doit_first:
+            exprs = [cached_doit(expr, self.on_phase) for expr in exprs]
+        return exprs
     
     def _cleanup_result(self, value):
         if isinstance(value, Expr):
-            raise CompareException("Result is still an expression. Check to be sure all free variables are passed in the compare call.")
+            raise CompareException(MISSING_SYMBOLS_MESSAGE)
         return value
 
     def cleanup_for_lambdify(self, expr):
-        real_imag = expr.as_real_imag()
-        return float(real_imag[0]) + 1j * float(real_imag[1])
+        return _complex_values.get_or_compute(expr, lambda: complex(expr))
     
     def _check_for_zero(self, value):
         return value == 0
@@ -0,0 +1,30 @@
+import sys
+from checksym.util import LRUCache
+
+# The same expression is often compared again and again at the same test values,
+# as when checking many rewrites of one expression against it. Keep the values of
+# each expression, so only the other side of each comparison is evaluated.
+#
+# Values are keyed by (backend, doit, expression, symbols, points), where points
+# is either one test value set as a tuple, or a tuple of them for values evaluated
+# at all the sets at once.
+
+def _entry_size(key, value):
+    """
+    Rough size of an entry in bytes. The expressions in the key are shared with
+    the caller, so only the values and the key's own tuple are counted.
+    """
+    return sys.getsizeof(key) + getattr(value, 'nbytes', sys.getsizeof(value))
+
+value_cache = LRUCache(maxsize=4096, maxbytes=32 * 1024 * 1024, sizeof=_entry_size)
+
+def value_key(backend, doit, expr, symbols, points):
+    """
+    The value_cache key for the values of expr at points
+
+    Args:
+    backend: Name of the backend evaluating expr
+    doit: True if doit() is applied to expr first
+    points: A test value set as a tuple, or a tuple of them
+    """
+    return (backend, doit, expr, tuple(symbols), points)
@@ -0,0 +1,131 @@
+import heapq
+import logging
+import time
+from threading import RLock
+from .impl import compiled_cache, doit_cache, value_cache
+
+logger = logging.getLogger(__name__)
+
+class Profile:
+    """
+    Timings and counters for one comparison.
+
+    Time is split between the steps the comparison goes through: the phases reported
+    through on_phase ('prepare', 'doit', 'lambdify', 'evaluate'), plus the steps of
+    'prepare' that only show up here ('replace_infinite_integrals', 'build_test_value_sets').
+    """
+
+    def __init__(self, on_phase=None):
+        """
+        Args:
+        on_phase: Called with each phase, as for Compare
+        """
+        self.on_phase = on_phase
+        self.timings = {}
+        self.counters = {}
+        self._step = None
+        self._step_start = None
+        self._start = time.perf_counter()
+        self._cache_stats = (compiled_cache.stats(), doit_cache.stats(), value_cache.stats())
+
+    def phase(self, name):
+        """
+        Enter a phase. Can be used as an on_phase callback.
+        """
+        self.step(name)
+        if self.on_phase:
+            self.on_phase(name)
+
+    def step(self, name):
+        """
+        Start timing a step, without reporting it as a phase
+        """
+        now = time.perf_counter()
+        self._stop(now)
+        self._step = name
+        self._step_start = now
+        logger.debug("Entering %s", name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        """
+        Stop timing, and return {'total': seconds, 'timings': {step: seconds}, 'counters': {name: count}}
+
+        The counters include hits and misses of the compiled expression, doit()
+        and value caches while the comparison ran. Those caches are shared, so comparisons
+        running at the same time in other threads are counted too.
+        """
+        now = time.perf_counter()
+        self._stop(now)
+        for (name, (before, after)) in (('compile', (self._cache_stats[0], compiled_cache.stats())),
+            ('doit', (self._cache_stats[1], doit_cache.stats())),
+            ('value', (self._cache_stats[2], value_cache.stats()))):
+            self.count(name + '_cache_hits', after['hits'] - before['hits'])
+            self.count(name + '_cache_misses', after['misses'] - before['misses'])
+        profile = {'total': now - self._start, 'timings': self.timings, 'counters': self.counters}
+        logger.debug("Comparison took %.6f seconds: %s", profile['total'], profile)
+        return profile
+
+    def _stop(self, now):
+        if self._step != None:
+            self.timings[self._step] = self.timings.get(self._step, 0) + now - self._step_start
+            self._step = None
+
+class ProfileSummary:
+    """
+    Totals of the profiles of many comparisons, and the slowest of them.
+
+    Comparisons running in several threads, as under acompare, can add to the same summary.
+    """
+
+    def __init__(self, slowest=10):
+        """
+        Args:
+        slowest: Number of the slowest comparisons to keep
+        """
+        self.max_slowest = slowest
+        self._lock = RLock()
+        self.clear()
+
+    def add(self, expr1, expr2, symbols, profile):
+        with self._lock:
+            self.comparisons += 1
+            self.total += profile['total']
+            for (step, seconds) in profile['timings'].items():
+                self.timings[step] = self.timings.get(step, 0) + seconds
+            for (name, count) in profile['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + count
+            # The counter breaks ties, so the expressions themselves are never compared
+            entry = (profile['total'], self._added, expr1, expr2, symbols)
+            self._added += 1
+            if len(self._slowest) < self.max_slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def clear(self):
+        with self._lock:
+            self.comparisons = 0
+            self.total = 0
+            self.timings = {}
+            self.counters = {}
+            self._slowest = []
+            self._added = 0
+
+    def summary(self):
+        """
+        Returns a dict with the number of comparisons, the total seconds, the totals
+        of the timings and counters, and 'slowest', a list of (seconds, expr1, expr2, symbols)
+        for the slowest comparisons, slowest first.
+        """
+        with self._lock:
+            return {
+                'comparisons': self.comparisons,
+                'total': self.total,
+                'timings': dict(self.timings),
+                'counters': dict(self.counters),
+                'slowest': [(seconds, expr1, expr2, symbols)
+                    for (seconds, _, expr1, expr2, symbols) in sorted(self._slowest, reverse=True)]
+            }
@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import pickle
+import sqlite3
+import time
+from sympy import srepr
+from checksym.version import __version__
+
+class PersistentResultCache:
+    """
+    Comparison results stored in a SQLite file, so they survive the process and
+    can be shared by several processes on the same machine.
+
+    Entries are keyed on the expressions, the symbols with their assumptions, the
+    Compare settings that can change a result, and the checksym version, so upgrading
+    checksym starts from an empty cache.
+
+    The results are pickled, so only use cache files you created yourself.
+    """
+
+    def __init__(self, path, max_entries=None, max_bytes=None):
+        """
+        Args:
+        path: The SQLite file. It's created if it doesn't exist.
+        max_entries: Prune the least recently used entries beyond this many
+        max_bytes: Prune the least recently used entries once the stored results
+            take more than this many bytes
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def _connect(self):
+        # A connection per operation keeps this safe to use from threads and
+        # from forked worker processes. The timeout makes concurrent writers
+        # wait for each other instead of failing.
+        conn = sqlite3.connect(self.path, timeout=60)
+        return _Closing(conn)
+
+    @staticmethod
+    def key(expr1, expr2, symbols, settings=()):
+        """
+        A canonical string for the comparison, hashed to keep the keys short
+
+        Args:
+        settings: (name, value) pairs of the settings the result depends on
+        """
+        parts = [__version__, srepr(expr1), srepr(expr2)]
+        for symbol in symbols:
+            parts.append(srepr(symbol))
+            parts.append(repr(sorted(symbol.assumptions0.items())))
+        parts.append(repr(sorted(settings)))
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def get(self, expr1, expr2, symbols, settings=()):
+        """
+        Return (True, result, timings) if the comparison is cached, otherwise (False, None, None)
+        """
+        key = self.key(expr1, expr2, symbols, settings)
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return (False, None, None)
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        (result, timings) = pickle.loads(row[0])
+        return (True, result, timings)
+
+    def put(self, expr1, expr2, symbols, result, timings, settings=()):
+        key = self.key(expr1, expr2, symbols, settings)
+        value = pickle.dumps((result, timings))
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()))
+        if self.max_entries != None or self.max_bytes != None:
+            self.prune()
+
+    def prune(self, max_entries=None, max_bytes=None):
+        """
+        Delete the least recently used entries until the cache is within the limits.
+
+        The limits default to the ones given to the constructor. Returns the number
+        of entries deleted.
+        """
+        max_entries = self.max_entries if max_entries == None else max_entries
+        max_bytes = self.max_bytes if max_bytes == None else max_bytes
+        deleted = 0
+        with self._connect() as conn:
+            if max_entries != None:
+                deleted += conn.execute("""DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)""",
+                    (max_entries,)).rowcount
+            if max_bytes != None:
+                # Keep the most recently used entries whose sizes add up to no more than max_bytes
+                deleted += conn.execute("""DELETE FROM results WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM results)
+                    WHERE total > ?)""", (max_bytes,)).rowcount
+        return deleted
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._connect() as conn:
+            (entries, size) = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {'entries': entries, 'bytes': size}
+
+class _Closing:
+    """
+    Commit or roll back like sqlite3's own context manager, then close the connection
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type == None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prune a checksym result cache file")
+    parser.add_argument('path')
+    parser.add_argument('--max-entries', type=int)
+    parser.add_argument('--max-bytes', type=int)
+    args = parser.parse_args(argv)
+    cache = PersistentResultCache(args.path)
+    deleted = cache.prune(args.max_entries, args.max_bytes)
+    print("Deleted " + str(deleted) + " entries. Remaining: " + str(cache.stats()))
+
+if __name__ == '__main__':
+    main()
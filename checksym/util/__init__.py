@@ -1,3 +1,7 @@
-from .compare_to_significance import convert_to_order_one, compare_to_significance, compare_to_significance_complex
-from .assumptions import get_test_numbers_for_assumptions, build_test_value_sets
+from .compare_to_significance import (convert_to_order_one, compare_to_significance, compare_to_significance_complex,
+    compare_to_significance_array, compare_to_significance_complex_array)
+from .assumptions import (get_test_numbers_for_assumptions, build_test_value_sets, build_test_value_array,
+    as_test_value_array, test_value_cache)
 from .manipulation import remove
+from .lru_cache import LRUCache
+from .traversal import fold_tree, rebuild
@@ -1,6 +1,12 @@
 from itertools import cycle, islice
 from sympy import *
 from pprint import pp
+from .lru_cache import LRUCache
+
+# Test values depend only on the symbols' assumptions. Building them means
+# constructing sympy numbers, and a throwaway Symbol for each complex symbol,
+# so they are built once for each combination of assumptions.
+test_value_cache = LRUCache(maxsize=256)
 
 def get_test_numbers_for_assumptions(assumptions0, scale):
     """
@@ -100,12 +106,43 @@ def build_test_value_sets(*symbols):
 
     """
 
+    return [list(test_value_set) for test_value_set in _cached_test_values(symbols)]
+
+def build_test_value_array(*symbols):
+    """
+    The test values from build_test_value_sets as a read-only complex128 array,
+    with one row per test value set and one column per symbol.
+    """
+    return test_value_cache.get_or_compute(('array', _assumptions_key(symbols)),
+        lambda: _build_test_value_array(_cached_test_values(symbols)))
+
+def as_test_value_array(test_value_sets):
+    """
+    The given test value sets as a read-only complex128 array, with one row per
+    test value set and one column per symbol.
+
+    Arrays are cached by the values, so the same sets, as from build_test_value_sets,
+    are converted once.
+    """
+    points = tuple(map(tuple, test_value_sets))
+    return test_value_cache.get_or_compute(('array', points), lambda: _build_test_value_array(points))
+
+def _assumptions_key(symbols):
+    return tuple(tuple(sorted(symbol.assumptions0.items())) for symbol in symbols)
+
+def _cached_test_values(symbols):
+    return test_value_cache.get_or_compute(_assumptions_key(symbols), lambda: _build_test_values(symbols))
+
+def _build_test_values(symbols):
+    """
+    Returns the test value sets as a tuple of tuples of sympy numbers
+    """
     scale = 1
     scale_increment = 2
 
     def get_test_numbers_for_symbol(symbol):
         nonlocal scale
-        ret_val = get_test_numbers_for_assumptions(symbol.assumptions0, scale)
+        ret_val = list(get_test_numbers_for_assumptions(symbol.assumptions0, scale))
         scale = scale + scale_increment
         return ret_val
     
@@ -128,7 +165,15 @@ def build_test_value_sets(*symbols):
     for i in range(0, test_value_sets_size):
         def fn(set_for_symbol):
             return set_for_symbol[i % len(set_for_symbol)]
-        this_set = list(map(fn, test_numbers))
+        this_set = tuple(map(fn, test_numbers))
         test_value_sets.append(this_set)
 
-    return test_value_sets
\ No newline at end of file
+    return tuple(test_value_sets)
+
+def _build_test_value_array(test_value_sets):
+    # Imported here, so comparisons that never need the array don't load numpy
+    import numpy
+    test_value_array = numpy.array([[complex(value) for value in this_set] for this_set in test_value_sets],
+        dtype=complex)
+    test_value_array.flags.writeable = False
+    return test_value_array
\ No newline at end of file
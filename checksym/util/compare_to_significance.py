@@ -56,3 +56,56 @@ def compare_to_significance(a, b, places):
     b_converted_2 = round(b_converted*10**(places-1))
 
     return a_converted_2 == b_converted_2
+
+
+def compare_to_significance_complex_array(a_real, a_imaginary, b_real, b_imaginary, places):
+    """
+    Array version of compare_to_significance_complex
+
+    Returns a boolean mask that is True where the values match, and the index
+    of the first mismatch, or None if everything matches.
+    """
+    # Only the array versions need numpy, so it's loaded when they're first used
+    import numpy
+    mask = (compare_to_significance_array(a_real, b_real, places)
+        & compare_to_significance_array(a_imaginary, b_imaginary, places))
+    mismatches = numpy.flatnonzero(~mask)
+    first_mismatch = int(mismatches[0]) if len(mismatches) else None
+    return (mask, first_mismatch)
+
+
+def compare_to_significance_array(a, b, places):
+    """
+    Array version of compare_to_significance. Returns a boolean mask.
+
+    The rules are the same as for the scalar version. NaN and infinite values,
+    where the scalar version raises, never match.
+    """
+    import numpy
+    a = numpy.asarray(a, dtype=float)
+    b = numpy.asarray(b, dtype=float)
+
+    both_zero = (a == 0) & (b == 0)
+    candidates = (a != 0) & (b != 0) & ~((a > 0) & (b < 0)) & ~((b > 0) & (a < 0))
+    candidates &= numpy.isfinite(a) & numpy.isfinite(b)
+
+    with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        a = numpy.abs(a)
+        b = numpy.abs(b)
+
+        # Shift the decimal point to where exactly one digit is to the right
+        a_places = numpy.floor(numpy.log10(a))
+        b_places = numpy.floor(numpy.log10(b))
+        a_converted = a * 10.0 ** (-a_places)
+        b_converted = b * 10.0 ** (-b_places)
+
+        # Allow the magnitudes to differ by one, as the scalar version does
+        a_converted = numpy.where(a_places == b_places - 1, a_converted / 10, a_converted)
+        b_converted = numpy.where(a_places == b_places + 1, b_converted / 10, b_converted)
+        candidates &= numpy.abs(a_places - b_places) <= 1
+
+        # Convert to integers of the desired number of digits
+        a_converted_2 = numpy.rint(a_converted * 10.0 ** (places - 1))
+        b_converted_2 = numpy.rint(b_converted * 10.0 ** (places - 1))
+
+    return both_zero | (candidates & (a_converted_2 == b_converted_2))
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from threading import RLock
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entry once full.
+
+    Keeps hit, miss and eviction counters so callers can check whether a
+    cache is actually paying for itself. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None):
+        """
+        Args:
+        maxsize: Maximum number of entries to keep. None means unbounded.
+        maxbytes: Maximum total size of the entries, as measured by sizeof. None means unbounded.
+        sizeof: Called as sizeof(key, value) to estimate the size of an entry in bytes.
+            Only needed with maxbytes.
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(key, value) if self.maxbytes != None else 0
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, calling compute() to fill it on a miss.
+
+        compute runs outside the lock, so two threads missing on the same key
+        may both compute it. The last one to finish wins, which is harmless
+        for the pure functions cached here.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _evict(self):
+        while self._data and ((self.maxsize != None and len(self._data) > self.maxsize)
+                or (self.maxbytes != None and self.bytes > self.maxbytes)):
+            (key, _) = self._data.popitem(last=False)
+            self.bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all entries and reset the counters
+        """
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self.bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -1,11 +1,16 @@
+from bisect import bisect_left
+from .traversal import fold_tree
+
 def remove(expr, *search):
 
     """
-    Remove an expression from another expression
-    
+    Remove expressions from another expression, in a single pass. Terms that sympy
+    merges once others are removed are still matched separately, which can give a
+    different result from removing each search expression in turn.
+
     Keyword arguments:
     expr -- the expression to search through
-    search -- the subexpression to find and remove
+    search -- the subexpressions to find and remove
 
     We know that the search expression will be one of these
     1) An argument to Add()
@@ -16,21 +21,80 @@ def remove(expr, *search):
     2) An argument to Rational()
     3) An argument to some other function
 
+    The search expressions are removed in the order given: one only matches an
+    argument that is still there once the earlier ones have been removed, so
+    removing x from x*y leaves y rather than a match for x*y. A Mul or Add cut
+    down to a single argument becomes that argument, which is then matched as an
+    argument of its parent, not of its own.
+
+    Removing each in turn would rebuild the expression in between, and sympy would
+    merge terms: removing x and then z from x*z + y + z gives y + 2, as x*z + z
+    becomes 2*z first. Here x*z and z are still separate terms when z is removed,
+    so the result is y.
+
+    A subtree that appears more than once is handled once, and subtrees that
+    contain none of the search expressions are kept as they are rather than rebuilt.
+
     """
 
-    def _remove(expr, search):
+    # Stage N is the expression left once the first N search expressions have been
+    # removed. These are the stages at which each one is removed.
+    stages = {}
+    for (stage, term) in enumerate(search):
+        stages.setdefault(term, []).append(stage)
+
+    # Each node's history: a (stage, expression) pair for each stage at which it
+    # changes, starting with (0, node)
+    def history(node, arg_histories):
+        removed = _removed_args(node, arg_histories, stages) if node.is_Mul or node.is_Add else {}
+        return _history(node, arg_histories, removed)
 
-        if expr.is_Atom or expr.is_Dummy:
+    return fold_tree(expr, history)[-1][1]
+
+def _at(history, stage):
+    """
+    The expression a history has at stage
+    """
+    for (start, expr) in reversed(history):
+        if start <= stage:
             return expr
-        elif expr.is_Mul or expr.is_Add:
-            newargs = map(lambda arg: remove(arg, search), filter(lambda n: n!=search, expr.args))
-            return expr.func(*newargs)
-        else:
-            newargs = map(lambda arg: remove(arg, search), expr.args)
-            return expr.func(*newargs)
-    
-    expr = _remove(expr, search[0])
-    if len(search) == 1:
-        return expr
-    else:
-        return remove(expr, *search[1:])
\ No newline at end of file
+
+def _removed_args(node, arg_histories, stages):
+    """
+    The stage at which each arg of a Mul or Add is removed, by the index of the arg
+    """
+    # The first stage at which each arg matches the search expression removed then
+    matches = []
+    for (i, history) in enumerate(arg_histories):
+        for (n, (start, expr)) in enumerate(history):
+            # An arg of the same type as node would have been merged into it
+            if expr.func == node.func or expr not in stages:
+                continue
+            end = history[n + 1][0] if n + 1 < len(history) else None
+            at = stages[expr]
+            j = bisect_left(at, start)
+            if j < len(at) and (end == None or at[j] < end):
+                matches.append((at[j], i))
+                break
+    removed = {}
+    remaining = len(arg_histories)
+    for (stage, i) in sorted(matches):
+        # With one arg left, node has become that arg, so it's up to node's parent
+        if remaining < 2:
+            break
+        removed[i] = stage
+        remaining -= 1
+    return removed
+
+def _history(node, arg_histories, removed):
+    """
+    The history of node, from those of its args and the stages at which any are removed
+    """
+    changes = {start for history in arg_histories for (start, _) in history[1:]}
+    changes.update(stage + 1 for stage in removed.values())
+    history = [(0, node)]
+    for change in sorted(changes):
+        args = [_at(arg_history, change) for (i, arg_history) in enumerate(arg_histories)
+            if removed.get(i, change) >= change]
+        history.append((change, node.func(*args)))
+    return history
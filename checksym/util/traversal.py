@@ -0,0 +1,41 @@
+def fold_tree(expr, combine, memo=None, descend=None):
+    """
+    Compute a value for each node of expr from the values of its args, leaves first,
+    and return the value for expr.
+
+    The tree is walked with an explicit stack rather than recursion, so deep
+    expressions are fine. Each node is visited once to push its args, and again
+    to combine their values. A subtree that appears more than once is combined once.
+
+    Args:
+    combine: Called as combine(node, values), where values is a list of the values of
+        node's args, in order. Empty for leaves.
+    memo: A dict of the values of subtrees already visited. Pass the same one for
+        expressions sharing subtrees.
+    descend: Called with each node that has args. When it returns False, they aren't
+        visited, and combine gets no values for them. Defaults to visiting every node.
+    """
+    if memo is None:
+        memo = {}
+    stack = [(expr, False)]
+    while stack:
+        (node, args_done) = stack.pop()
+        if node in memo:
+            continue
+        if args_done:
+            memo[node] = combine(node, [memo[arg] for arg in node.args])
+        elif not node.args or (descend != None and not descend(node)):
+            memo[node] = combine(node, [])
+        else:
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in node.args if arg not in memo)
+    return memo[expr]
+
+def rebuild(node, args):
+    """
+    node with its args replaced, or node itself if they are all the same objects,
+    so untouched subtrees aren't rebuilt
+    """
+    if len(args) == len(node.args) and all(new is old for (new, old) in zip(args, node.args)):
+        return node
+    return node.func(*args)
@@ -1,7 +1,9 @@
 import unittest
 from sympy import symbols, Rational, I, E, Symbol
 from pprint import pp
-from checksym.util import get_test_numbers_for_assumptions, build_test_value_sets
+import numpy
+from checksym.util import (get_test_numbers_for_assumptions, build_test_value_sets, build_test_value_array,
+    as_test_value_array)
 
 class TestAssumptions(unittest.TestCase):
     
@@ -73,4 +75,36 @@ class TestAssumptions(unittest.TestCase):
         y = symbols("y", integer=True, positive=True)
         z = symbols("z", integer=True, positive=True)
         test_sets = build_test_value_sets(x, y, z)
-        self.assertEqual([[2, 6, 10], [5, 15, 25], [3, 9, 15]], test_sets)
\ No newline at end of file
+        self.assertEqual([[2, 6, 10], [5, 15, 25], [3, 9, 15]], test_sets)
+
+    def test_build_test_value_sets_for_imaginary(self):
+        y = symbols("y", imaginary=True)
+        self.assertEqual([[13*I/10], [I/7], [-12*I/5]], build_test_value_sets(y))
+
+    def test_build_test_value_sets_returns_new_lists(self):
+        x = symbols("x", real=True)
+        build_test_value_sets(x)[0][0] = 0
+        build_test_value_sets(x).append([0])
+        self.assertEqual([[Rational(13, 10)], [Rational(1, 7)], [-Rational(12, 5)]], build_test_value_sets(x))
+
+    def test_build_test_value_array(self):
+        z = symbols("z", complex=True)
+        n = symbols("n", integer=True, positive=True)
+        array = build_test_value_array(z, n)
+        self.assertEqual(numpy.complex128, array.dtype)
+        numpy.testing.assert_array_equal(
+            [[complex(value) for value in test_value_set] for test_value_set in build_test_value_sets(z, n)], array)
+        self.assertFalse(array.flags.writeable)
+
+        # Only the assumptions matter
+        w = symbols("w", complex=True)
+        m = symbols("m", integer=True, positive=True)
+        self.assertIs(array, build_test_value_array(w, m))
+
+    def test_as_test_value_array(self):
+        z = symbols("z", complex=True)
+        test_value_sets = build_test_value_sets(z)
+        array = as_test_value_array(test_value_sets)
+        numpy.testing.assert_array_equal([[complex(value) for value in test_value_set] for test_value_set in test_value_sets], array)
+        self.assertIs(array, as_test_value_array(build_test_value_sets(z)))
+        self.assertEqual((1, 1), as_test_value_array([[Rational(2)]]).shape)
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from checksym import Compare
+from sympy import symbols, sin, cos, exp, expand, Integral, oo, sqrt, pi
+from sympy.utilities.lambdify import implemented_function
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_acompare(self):
+        x = symbols("x", real=True)
+        compare = Compare()
+        self.assertEqual(None, await compare.acompare(sin(x)**2 + cos(x)**2, 1, x))
+        result = await compare.acompare(sin(x), cos(x), x)
+        self.assertEqual(result, compare.compare(sin(x), cos(x), x))
+
+    async def test_achange(self):
+        x = symbols("x", real=True)
+        compare = Compare()
+        expr = (x + 1)**3*exp(x)
+        self.assertEqual(expand(expr), await compare.achange(expr, expand, x))
+        result = await compare.achange(expr, lambda e: 2*e, x)
+        self.assertTrue(isinstance(result, dict))
+
+    async def test_acompare_many(self):
+        x = symbols("x", real=True)
+        jobs = [(sin(x)**2, 1 - cos(x)**2, x), (sin(x), cos(x), x), ((x + 1)**2, x**2 + 2*x + 1, x)]
+        compare = Compare(executor=ThreadPoolExecutor(4), max_concurrent=2)
+        results = {index: result async for (index, result) in compare.acompare_many(jobs)}
+        self.assertEqual([0, 1, 2], sorted(results))
+        self.assertEqual(None, results[0])
+        self.assertNotEqual(None, results[1])
+        self.assertEqual(None, results[2])
+
+    async def test_max_concurrent(self):
+        running = []
+        most = []
+        lock = threading.Lock()
+
+        class SlowCompare(Compare):
+            def compare_detailed(self, expr1, expr2, *symbols):
+                with lock:
+                    running.append(1)
+                    most.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.pop()
+                return {'result': None, 'tier': None, 'tier_timings': {}}
+
+        x = symbols("x", real=True)
+        compare = SlowCompare(executor=ThreadPoolExecutor(8), max_concurrent=2)
+        await asyncio.gather(*(compare.acompare(x, x + i, x) for i in range(8)))
+        self.assertEqual(2, max(most))
+
+    async def test_cancel_stops_test_value_sets(self):
+        calls = []
+
+        def slow(v):
+            calls.append(v)
+            time.sleep(0.2)
+            # complex() only takes one value, so the test value sets go one at a time
+            return complex(v)
+
+        x = symbols("x", real=True)
+        f = implemented_function('slow_cancelled', slow)
+        compare = Compare(tiers=('float',))
+        task = asyncio.ensure_future(compare.acompare(f(x), 2*f(x), x))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(1)
+        # Running to the end would take 7 calls: one for the attempt at all the
+        # test value sets at once, then one per expression for each of the 3
+        self.assertLessEqual(len(calls), 2)
+
+    async def test_process_executor(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        with ProcessPoolExecutor(1) as executor:
+            compare = Compare(executor=executor)
+            result = await compare.acompare(Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), a)
+        self.assertEqual(None, result)
+
+class TestAsyncEventLoops(unittest.TestCase):
+
+    def test_several_event_loops(self):
+        """
+        max_concurrent holds in each loop, and a Compare can be used from one loop after another
+        """
+        x = symbols("x", real=True)
+        compare = Compare(max_concurrent=1)
+
+        async def run():
+            return await asyncio.gather(compare.acompare(sin(x)**2, 1 - cos(x)**2, x), compare.acompare(sin(x), cos(x), x))
+
+        for _ in range(2):
+            (same, different) = asyncio.run(run())
+            self.assertEqual(None, same)
+            self.assertNotEqual(None, different)
@@ -0,0 +1,41 @@
+import unittest
+import io
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from benchmarks.run import main, compare_runs
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run_and_compare_with_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            with redirect_stdout(io.StringIO()):
+                self.assertEqual(0, main(['--cases', 'gaussian_integral', 'polynomial_identity',
+                    '--modes', 'default', '--repeat', '1', '--output', path]))
+            with open(path) as f:
+                run = json.load(f)
+
+        self.assertEqual(['gaussian_integral', 'polynomial_identity'], [result['case'] for result in run['results']])
+        (gaussian, polynomial) = run['results']
+        self.assertEqual(['float'], gaussian['tiers'])
+        self.assertEqual(['match'], gaussian['outcomes'])
+        self.assertIn('evaluate', gaussian['phases'])
+        self.assertGreater(gaussian['peak_memory'], 0)
+        self.assertEqual(['exact'], polynomial['tiers'])
+        self.assertEqual(2, run['summary']['default']['comparisons'])
+        self.assertEqual(0, run['summary']['default']['fallback_rate'])
+
+        self.assertEqual([], run['imports']['import checksym']['modules'])
+        self.assertNotIn('numpy', run['imports']['Compare()']['modules'])
+
+        slower = json.loads(json.dumps(run))
+        slower['results'][0]['cold'] *= 2
+        slower['imports']['import checksym']['median'] *= 2
+        rows = compare_runs(run, slower, 1.25)
+        self.assertEqual([('gaussian_integral', 'cold'), ('import checksym', 'median')],
+            [(case, measure) for (case, _, measure, *_, regressed) in rows if regressed])
+
+if __name__ == '__main__':
+    unittest.main()
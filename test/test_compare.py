@@ -1,7 +1,17 @@
 import unittest
 from checksym import Compare, remove
-from sympy import Integral, symbols, exp, oo, E, sqrt, I, pi, conjugate, Abs, im, simplify, expand, diff, UnevaluatedExpr
+from checksym.compare.impl import compiled_cache, doit_cache, value_cache, clear_caches, cache_stats
+from checksym.compare.compare import replace_infinite_integrals
+from checksym.compare.profile import ProfileSummary
+from sympy import Integral, Mul, symbols, exp, cosh, sin, cos, Function, lerchphi, Rational, oo, E, sqrt, I, pi, conjugate, Abs, im, simplify, expand, diff, UnevaluatedExpr, Eq
 from sympy.physics.quantum import hbar
+from sympy.utilities.lambdify import implemented_function
+import threading
+import time
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import weakref
 from pprint import pp
 
 class TestCompare(unittest.TestCase):
@@ -46,6 +56,47 @@ class TestCompare(unittest.TestCase):
         modified_expr = remove(expr, x, y)
         self.assertEqual(z, modified_expr)
 
+    def test_remove_multiple_nested(self):
+        x, y, z = symbols("x y z")
+        expr = Integral(x*y*exp(z + y), (z, 0, 1)) + sin(x*z)*y
+        modified_expr = remove(expr, x, y)
+        self.assertEqual(Integral(exp(z), (z, 0, 1)) + sin(z), modified_expr)
+
+    def test_remove_in_order(self):
+        w, x, y, z = symbols("w x y z")
+        # As removing each in turn did
+        self.assertEqual(w + z, remove(w*(x+y)+z, x, y))
+        self.assertEqual(y, remove(2*x+y, x, 2))
+        self.assertEqual(y + z, remove(z+x*y, x, x*y))
+        self.assertEqual(w + x*y, remove(x*y*z+w, x*y, z))
+        self.assertEqual(y, remove(x*y, x, y))
+
+    def test_remove_merged_terms(self):
+        """
+        Removing x and then z in turn would give y + 2, as x*z + z becomes 2*z in
+        between. In one pass, x*z and z are still separate terms when z is removed.
+        """
+        v, w, x, y, z = symbols("v w x y z")
+        self.assertEqual(y, remove(x*z + y + z, x, z))
+        expr = v*y + 2*w*x + 2*w + x + 18*y*z + y + z + sin(v)
+        self.assertEqual(v + 3*x + sin(v) + 20, remove(expr, y, w, z))
+
+    def test_remove_nothing_found(self):
+        x, y, z = symbols("x y z")
+        expr = Integral(x*exp(-x**2), (x, 0, 1)) + sin(y)
+        self.assertIs(expr, remove(expr, z, 2*z))
+
+    def test_remove_deep(self):
+        x, y, z = symbols("x y z")
+        expr = x*y
+        for _ in range(1000):
+            expr = sin(expr + z)
+        node = remove(expr, y)
+        # Too deep for sympy's own recursive traversals, so walk down to the product
+        while node.args:
+            node = next(arg for arg in node.args if arg != z)
+        self.assertEqual(x, node)
+
     def test_remove_from_sum_in_denominator(self):
         """
         Where an expression is removed from a sum in a denominator.
@@ -297,9 +348,417 @@ class TestCompare(unittest.TestCase):
         self.assertEqual(result["exception"], "Result is still an expression. Check to be sure all free variables are passed in the compare call.")
 
 
+    def test_expression_compiled_once(self):
+        """
+        Each expression should be lambdified once, no matter how many test value
+        sets or Compare instances use it.
+        """
+        z = symbols("z", complex=True)
+        n = symbols("n", positive=True)
+        expr1 = (n+z)*(sin(z)**2+cos(z)**2)
+        expr2 = n+z
+        compiled_cache.clear()
+        value_cache.clear()
+        self.assertCompareResultSuccess(self.compare.compare(expr1, expr2, z, n))
+        self.assertEqual(2, compiled_cache.misses)
+        self.assertCompareResultSuccess(Compare().compare(expr1, expr2, z, n))
+        self.assertEqual(2, compiled_cache.misses)
+
+
+    def test_doit_run_once(self):
+        """
+        The doit-first pass needs doit() once per expression, whatever the
+        number of test value sets or Compare instances.
+        """
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        n = symbols("n", positive=True)
+        expr1 = Integral(hbar**2*n**2*x**2*exp(-x**2/a**2)/a**4, (x, -oo, oo))
+        expr2 = hbar**2*n**2*Integral(x**2*exp(-x**2/a**2), (x, -oo, oo))/a**4
+        # The float tier settles these by itself now, so skip straight to doit
+        doit_cache.clear()
+        self.assertCompareResultSuccess(Compare(tiers=('doit',)).compare(expr1, expr2, a, n))
+        self.assertEqual(2, doit_cache.misses)
+        self.assertCompareResultSuccess(Compare(tiers=('doit',)).compare(expr1, expr2, a, n))
+        self.assertEqual(2, doit_cache.misses)
+
+    def test_narrow_peak_integral(self):
+        """
+        An integral the batch quadrature can't resolve isn't taken to be zero
+        """
+        x = symbols("x", real=True)
+        a = symbols("a", real=True, positive=True)
+        result = self.compare.compare(a*(Integral(exp(-10**6*x**2), (x, -1, 1)) + 1), a, a)
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+    def test_clear_caches(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        Compare().compare(Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), a)
+        stats = cache_stats()
+        self.assertEqual(['compile', 'doit', 'value', 'test_value', 'split'], list(stats))
+        self.assertTrue(all(stats[name]['size'] > 0 for name in ('compile', 'value', 'test_value', 'split')))
+        clear_caches()
+        self.assertTrue(all(cache['size'] == 0 for cache in cache_stats().values()))
+
+    def test_values_cached(self):
+        """
+        Comparing one expression with several others evaluates it only once
+        """
+        x = symbols("x", real=True)
+        base = sin(x)**2*exp(x)
+        candidates = [(1 - cos(x)**2)*exp(x), exp(x) - cos(x)**2*exp(x), 2*sin(x)**2*exp(x)]
+        value_cache.clear()
+        compare = Compare(tiers=('float',))
+        self.assertCompareResultSuccess(compare.compare(base, candidates[0], x))
+        self.assertCompareResultSuccess(compare.compare(base, candidates[1], x))
+        result = compare.compare(base, candidates[2], x)
+        self.assertNotEqual(None, result)
+        self.assertEqual(2*result['expr1_final'], result['expr2_final'])
+        self.assertEqual(4, value_cache.misses)
+        self.assertEqual(2, value_cache.hits)
+
+    def test_values_cached_one_test_value_set_at_a_time(self):
+        x = symbols("x", real=True)
+        # Works on one value only, so can't be evaluated at all the test value sets at once
+        f = implemented_function('f', lambda v: complex(v))
+        value_cache.clear()
+        compare = Compare(tiers=('float',))
+        result = compare.compare(f(x), 2*f(x), x)
+        again = Compare(tiers=('float',)).compare(f(x), 2*f(x), x)
+        self.assertEqual(result['test_value_set'], again['test_value_set'])
+        self.assertEqual(result['expr1_final'], again['expr1_final'])
+        self.assertEqual(result['expr2_final'], again['expr2_final'])
+        self.assertGreater(value_cache.hits, 0)
+
+    def test_replace_infinite_integrals(self):
+        x, y = symbols("x y", real=True)
+        z = symbols("z", complex=True)
+        expr = z*Integral(exp(-x**2 - y**2), (x, -oo, oo), (y, oo, -oo)) + Integral(Integral(x*y, (x, -oo, oo)), (y, 0, 1))
+        expected = z*Integral(exp(-x**2 - y**2), (x, -1, 1), (y, 1, -1)) + Integral(Integral(x*y, (x, -1, 1)), (y, 0, 1))
+        self.assertEqual(expected, replace_infinite_integrals(expr))
+
+        unchanged = z*Integral(exp(-x**2), (x, 0, oo)) + sin(z)
+        self.assertIs(unchanged, replace_infinite_integrals(unchanged))
+
+    def test_replace_infinite_integrals_deep(self):
+        x = symbols("x", real=True)
+        z = symbols("z", complex=True)
+        expr = Integral(exp(-x**2), (x, -oo, oo))
+        for _ in range(1000):
+            expr = sin(expr + z)
+        node = replace_infinite_integrals(expr)
+        # Too deep for sympy's own recursive traversals, so walk down to the integral
+        while not isinstance(node, Integral):
+            node = next(arg for arg in node.args if arg != z)
+        self.assertEqual(Integral(exp(-x**2), (x, -1, 1)), node)
+
+    def test_compare_cache(self):
+        z = symbols("z", complex=True)
+        compare = Compare(cache_size=2)
+        compare.compare(z, 2*z, z)
+        compare.compare(z, 2*z, z)
+        self.assertEqual(1, compare.cache.hits)
+        self.assertEqual(1, compare.cache.misses)
+        compare.compare(z, 3*z, z)
+        compare.compare(z, 4*z, z)
+        self.assertEqual(1, compare.cache.evictions)
+        compare.cache.clear()
+        self.assertEqual(0, len(compare.cache))
+
+    def test_compare_cache_byte_limit(self):
+        z = symbols("z", complex=True)
+        compare = Compare(cache_size=None, cache_bytes=1)
+        compare.compare(z, 2*z, z)
+        self.assertEqual(0, len(compare.cache))
+        self.assertEqual(1, compare.cache.evictions)
+
+    def test_compare_does_not_keep_instance_alive(self):
+        z = symbols("z", complex=True)
+        compare = Compare()
+        compare.compare(z, 2*z, z)
+        ref = weakref.ref(compare)
+        del compare
+        gc.collect()
+        self.assertEqual(None, ref())
+
+    def test_change_cache(self):
+        z = symbols("z", complex=True)
+        calls = []
+        def op(expr):
+            calls.append(expr)
+            return expand(expr)
+        self.assertEqual(z**2 + 2*z + 1, self.compare.change((z + 1)**2, op, z))
+        self.assertEqual(z**2 + 2*z + 1, self.compare.change((z + 1)**2, op, z))
+        self.assertEqual(1, len(calls))
+
+    def test_compare_many(self):
+        z = symbols("z", complex=True)
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        jobs = [
+            (2*(z+x), 2*z+2*x, z, x),
+            (z, 2*z, z),
+            (Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), a)
+        ]
+        for workers in (1, 2):
+            results = dict(self.compare.compare_many(jobs, workers=workers))
+            self.assertEqual([0, 1, 2], sorted(results))
+            self.assertCompareResultSuccess(results[0])
+            self.assertNotEqual(None, results[1])
+            self.assertEqual(z, results[1]['expr1'])
+            self.assertCompareResultSuccess(results[2])
+
+    def test_compare_many_close(self):
+        """
+        Closing the generator early doesn't wait for the queued jobs
+        """
+        x = symbols("x", real=True)
+        jobs = [(x, x + i, x) for i in range(20)]
+        with mock.patch('checksym.compare.compare._compare_job', _slow_compare_job):
+            results = self.compare.compare_many(jobs, workers=2)
+            next(results)
+            start = time.monotonic()
+            results.close()
+            self.assertLess(time.monotonic() - start, 1)
+        # Let the jobs still running finish, so later tests start with no other threads
+        while threading.active_count() > 1 and time.monotonic() - start < 30:
+            time.sleep(0.1)
+
+    def test_compare_many_from_thread(self):
+        """
+        With other threads running, the workers aren't forked, but still work
+        """
+        x = symbols("x", real=True)
+        jobs = [(sin(x)**2 + cos(x)**2, 1, x), (sin(x), cos(x), x)]
+        with ThreadPoolExecutor(1) as executor:
+            results = executor.submit(lambda: dict(self.compare.compare_many(jobs, workers=2))).result()
+        self.assertCompareResultSuccess(results[0])
+        self.assertNotEqual(None, results[1])
+
+    def test_hard_time_limit(self):
+        """
+        An evaluation that never finishes is interrupted, and the result says where it was stuck
+        """
+        x = symbols("x", real=True)
+        slow = implemented_function('slow', lambda v: time.sleep(60) or v)
+        phases = []
+        compare = Compare(hard_time_limit=1, on_phase=phases.append)
+        start = time.monotonic()
+        result = compare.compare(slow(x), x, x)
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertTrue(result['timeout'])
+        self.assertTrue(result['error'])
+        self.assertEqual('evaluate', result['phase'])
+        self.assertEqual(['prepare', 'lambdify', 'evaluate'], phases)
+
+    def test_hard_time_limit_from_thread(self):
+        """
+        With other threads running, the child isn't forked, but still works
+        """
+        x = symbols("x", real=True)
+        compare = Compare(hard_time_limit=60)
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(None, executor.submit(compare.compare, sin(x)**2 + cos(x)**2, 1, x).result())
+            result = executor.submit(compare.compare, sin(x), cos(x), x).result()
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+    def test_canonical_size_limit(self):
+        """
+        Multiplying out a product of 18 binomials would take minutes, so the
+        canonical tier leaves it to the next one
+        """
+        ys = symbols("y1:19", positive=True)
+        rest = Mul(*(y + 1 for y in ys[1:]))
+        start = time.monotonic()
+        detailed = self.compare.compare_detailed((ys[0] + 1)*rest, ys[0]*rest + rest, *ys)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(None, detailed['result'])
+        self.assertEqual('exact', detailed['tier'])
+
+    def test_canonical_relations(self):
+        """
+        Relations can't be subtracted, so the canonical tier leaves them to the next one
+        """
+        x = symbols("x")
+        result = self.compare.compare(Eq(x, 1), Eq(1, x), x)
+        self.assertTrue(isinstance(result, dict))
+        self.assertNotEqual('canonical', result['tier'])
+
+    def test_tiers(self):
+        z = symbols("z", complex=True)
+        x = symbols("x", real=True)
+        compiled_cache.clear()
+        self.assertEqual('structural', self.compare.compare_detailed(exp(z), exp(z), z)['tier'])
+        self.assertEqual('canonical', self.compare.compare_detailed(x*(exp(z) + 1), x*exp(z) + x, z, x)['tier'])
+        self.assertEqual('exact', self.compare.compare_detailed((z + 1)**2, z**2 + 2*z + 1, z)['tier'])
+        self.assertEqual(0, compiled_cache.misses)
+
+        detailed = self.compare.compare_detailed(exp(2*z), exp(z)**2*sin(z)**2 + exp(2*z)*cos(z)**2, z)
+        self.assertEqual(None, detailed['result'])
+        self.assertEqual('float', detailed['tier'])
+        self.assertEqual(['structural', 'canonical', 'float'], list(detailed['tier_timings']))
+
+        result = self.compare.compare(exp(z), 2*exp(z), z)
+        self.assertEqual('float', result['tier'])
+        self.assertEqual(['structural', 'canonical', 'float', 'doit'], list(result['tier_timings']))
+
+        result = Compare(tiers=('float',)).compare(exp(z), 2*exp(z), z)
+        self.assertEqual(['float'], list(result['tier_timings']))
+
+    def test_profile(self):
+        z = symbols("z", complex=True)
+        compare = Compare(profile=True)
+        with self.assertLogs('checksym.compare.profile', level='DEBUG') as logs:
+            result = compare.compare(exp(z), 2*exp(z), z)
+        self.assertIn("DEBUG:checksym.compare.profile:Entering evaluate", logs.output)
+        profile = result['profile']
+        self.assertLessEqual({'prepare', 'build_test_value_sets', 'evaluate'}, set(profile['timings']))
+        self.assertEqual(2, profile['counters']['backend_passes'])
+        self.assertEqual(6, profile['counters']['test_value_sets'])
+        self.assertGreaterEqual(profile['total'], sum(profile['timings'].values()))
+
+        detailed = compare.compare_detailed(exp(2*z), exp(z)**2*sin(z)**2 + exp(2*z)*cos(z)**2, z)
+        self.assertEqual(None, detailed['result'])
+        self.assertEqual(1, detailed['profile']['counters']['backend_passes'])
+
+        summary = compare.profile_summary.summary()
+        self.assertEqual(2, summary['comparisons'])
+        self.assertEqual(3, summary['counters']['backend_passes'])
+        self.assertEqual({exp(z), exp(2*z)}, {expr1 for (_, expr1, _, _) in summary['slowest']})
+
+        self.assertNotIn('profile', self.compare.compare(exp(z), 2*exp(z), z))
+
+    def test_profile_summary_threads(self):
+        summary = ProfileSummary(slowest=3)
+        profile = {'total': 1.0, 'timings': {'evaluate': 1.0}, 'counters': {'backend_passes': 1}}
+        def add(i):
+            for _ in range(1000):
+                summary.add(i, i, (), profile)
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(add, range(8)))
+        result = summary.summary()
+        self.assertEqual(8000, result['comparisons'])
+        self.assertEqual(8000, result['counters']['backend_passes'])
+        self.assertEqual(3, len(result['slowest']))
+
+    def test_exact(self):
+        z = symbols("z", complex=True)
+        n = symbols("n", integer=True)
+        self.assertCompareResultSuccess(self.compare.compare((n+z)**3/(n-z), (n**3+3*n**2*z+3*n*z**2+z**3)/(n-z), z, n))
+        compiled_cache.clear()
+        result = self.compare.compare((n+z)**2, n**2+z**2, z, n)
+        test_values = dict(zip((z, n), result['test_value_set']))
+        self.assertEqual(expand((2*n*z).subs(test_values)), expand(result['expr1_final'] - result['expr2_final']))
+        # Nothing was lambdified
+        self.assertEqual(0, compiled_cache.misses)
+
+    def test_mpmath_fallback(self):
+        """
+        Both sides underflow to 0 as floats
+        """
+        a = symbols("a", positive=True)
+        expr1 = 1/cosh(1000*a)**2
+        self.assertCompareResultSuccess(self.compare.compare(expr1, 4/(exp(1000*a) + exp(-1000*a))**2, a))
+
+        result = self.compare.compare(expr1, 3/(exp(1000*a) + exp(-1000*a))**2, a)
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+        result = Compare(tiers=('float', 'doit')).compare(expr1, 4/(exp(1000*a) + exp(-1000*a))**2, a)
+        self.assertTrue(result['error'])
+
+    def test_evalf_fallback(self):
+        """
+        lambdify can't translate lerchphi
+        """
+        a = symbols("a", positive=True)
+        expr1 = lerchphi(Rational(1, 2), 2, a)
+        expr2 = lerchphi(Rational(1, 2), 2, a)*(sin(a)**2 + cos(a)**2)
+        self.assertCompareResultSuccess(self.compare.compare(expr1, expr2, a))
+
+        result = self.compare.compare(expr1, 2*lerchphi(Rational(1, 2), 2, a), a)
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('exception'))
+
+        result = Compare(tiers=('float', 'doit')).compare(expr1, expr2, a)
+        self.assertEqual("name 'lerchphi' is not defined", result['exception'])
+
+    def test_hard_time_limit_not_reached(self):
+        z = symbols("z", complex=True)
+        compare = Compare(hard_time_limit=60)
+        self.assertCompareResultSuccess(compare.compare(exp(2*z), exp(z)**2, z))
+        self.assertNotEqual(None, compare.compare(z, 2*z, z))
+
+
+    def test_race(self):
+        """
+        The direct evaluation is wrong here, but the doit-first one is right,
+        so the race should be won by the latter.
+        """
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        n = symbols("n", positive=True)
+        expr1 = Integral(hbar**2*n**2*x**2*exp(-x**2/a**2)/a**4, (x, -oo, oo))
+        expr2 = hbar**2*n**2*Integral(x**2*exp(-x**2/a**2), (x, -oo, oo))/a**4
+        compare = Compare(race=True)
+        self.assertCompareResultSuccess(compare.compare(expr1, expr2, a, n))
+
+    def test_race_prefers_comparison_failure(self):
+        n = symbols("n", positive=True)
+        x = symbols("x", real=True)
+        Delta = symbols("Delta", complex=True, real_part_positive=True)
+        expr1 = hbar**2*n**2*Integral(x**2*exp(-x**2*(conjugate(Delta)**2 + Delta**2)/(2*Abs(Delta)**4)), (x, -1, 1))/(Delta**2*conjugate(Delta)**2)
+        expr2 = hbar**2*n**2*Abs(Delta)**4*Integral(exp(-x**2*(conjugate(Delta)**2 + Delta**2)/(2*Abs(Delta)**4)), (x, -1, 1))/(Delta**2*(conjugate(Delta)**2 + Delta**2)*conjugate(Delta)**2)
+        result = Compare(race=True).compare(expr1, expr2, n, Delta)
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+        self.assertFalse(result.get('exception'))
+
+    def test_race_failure_not_final(self):
+        """
+        Values that differ don't end the race, as doit-first might still succeed.
+        Here it never finishes, so the race runs to hard_time_limit, and then the
+        comparison failure is reported rather than the timeout.
+        """
+        x = symbols("x", real=True)
+        start = time.monotonic()
+        result = Compare(race=True, hard_time_limit=3).compare(_StuckDoit(x), 2*_StuckDoit(x), x)
+        self.assertGreaterEqual(time.monotonic() - start, 3)
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('timeout'))
+        self.assertFalse(result.get('error'))
+
+    def test_race_hard_time_limit(self):
+        x = symbols("x", real=True)
+        slow = implemented_function('slow', lambda v: time.sleep(60) or v)
+        result = Compare(race=True, hard_time_limit=1).compare(slow(x), x, x)
+        self.assertTrue(result['timeout'])
+        self.assertEqual({'direct': 'evaluate', 'doit': 'evaluate'}, result['phases'])
+
+
     def assertCompareResultSuccess(self, result):
         if result != None:
             raise AssertionError("Compare failed", result)
 
+class _StuckDoit(Function):
+    """
+    Evaluates numerically to its argument, but its doit never finishes
+    """
+    _imp_ = staticmethod(lambda v: v)
+
+    def doit(self, **hints):
+        time.sleep(60)
+        return self
+
+def _slow_compare_job(settings, job):
+    """
+    Stands in for compare.compare._compare_job in worker processes
+    """
+    time.sleep(2)
+    return {'result': None}
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 import unittest
+import numpy
 from checksym.util import (convert_to_order_one, compare_to_significance,
-    compare_to_significance_complex)
+    compare_to_significance_complex, compare_to_significance_array,
+    compare_to_significance_complex_array)
 
 class TestCompareToSignificance(unittest.TestCase):
 
@@ -67,4 +69,39 @@ class TestCompareToSignificance(unittest.TestCase):
         self.assertTrue(compare_to_significance_complex(1, 0, 0.9999999999999998, 0, 3))
 
     def test_compare_to_significance_o(self):
-        self.assertFalse(compare_to_significance_complex(1, 0, 0.9999999999999998, 0, 17))
\ No newline at end of file
+        self.assertFalse(compare_to_significance_complex(1, 0, 0.9999999999999998, 0, 17))
+
+class TestCompareToSignificanceArray(unittest.TestCase):
+
+    def test_matches_scalar_version(self):
+        cases = [(0.01, 0.012, 1), (0.01, 0.012, 2), (0.12, 0.012, 2), (110000, 100000, 1),
+            (10000.000000001, 10000.000000011, 12), (10000.000000001, 10000.00000011, 13),
+            (0, 0, 3), (0, 1, 3), (1, 0, 3), (-1, 1, 3), (1, -1, 3), (-2.24, -2.23, 2),
+            (0.9999999999999998, 1, 3), (1, 0.9999999999999998, 17), (9.5, 10.4, 1)]
+        for (a, b, case_places) in cases:
+            # The places each case was written for, and a few others
+            for places in (case_places, 1, 3, 10):
+                expected = compare_to_significance(a, b, places)
+                self.assertEqual(expected, compare_to_significance_array([a], [b], places)[0], (a, b, places))
+
+    def test_matches_scalar_version_random(self):
+        rng = numpy.random.default_rng(1)
+        a = rng.standard_normal(2000) * 10.0 ** rng.integers(-30, 30, 2000)
+        b = a * (1 + rng.standard_normal(2000) * 10.0 ** rng.integers(-16, -2, 2000))
+        mask = compare_to_significance_array(a, b, 10)
+        self.assertEqual([compare_to_significance(x, y, 10) for x, y in zip(a, b)], list(mask))
+
+    def test_non_finite_never_matches(self):
+        mask = compare_to_significance_array([numpy.nan, numpy.inf], [numpy.nan, numpy.inf], 3)
+        self.assertEqual([False, False], list(mask))
+
+    def test_complex_first_mismatch(self):
+        (mask, first_mismatch) = compare_to_significance_complex_array(
+            [0, 2.24, 1], [2.24, 1, 1], [0, 2.24, 2], [2.23, -1, 1], 2)
+        self.assertEqual([True, False, False], list(mask))
+        self.assertEqual(1, first_mismatch)
+
+    def test_complex_all_match(self):
+        (mask, first_mismatch) = compare_to_significance_complex_array([1, 2], [0, 0], [1, 2], [0, 0], 3)
+        self.assertTrue(mask.all())
+        self.assertEqual(None, first_mismatch)
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+from checksym import Derivation, Compare
+from checksym.compare.impl import SciPyNumPy
+from sympy import Integral, symbols, exp, sin, cos, oo, sqrt, pi, im, expand, factor, trigsimp
+
+class TestDerivation(unittest.TestCase):
+
+    def test_each_expression_evaluated_once(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        expr = (x + a)**3*exp(-a*x) + sin(a*x)**2
+        ops = [expand, factor, lambda e: e + sin(a*x)**2 + cos(a*x)**2 - 1, trigsimp]
+        with mock.patch.object(SciPyNumPy, 'evaluate_values', autospec=True,
+                side_effect=SciPyNumPy.evaluate_values) as evaluate_values:
+            derivation = Derivation(expr, x, a)
+            result = derivation.run(ops)
+        self.assertFalse(isinstance(result, dict))
+        self.assertEqual(derivation.expr, result)
+        self.assertEqual(len(ops) + 1, len(derivation.expressions))
+        self.assertEqual([None]*len(ops), derivation.results)
+        self.assertEqual(None, derivation.broken_step)
+        # N+1 evaluations, not 2N
+        self.assertEqual(len(ops) + 1, evaluate_values.call_count)
+
+    def test_reports_first_broken_step(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        expr = sin(a*x)**2*exp(-x)
+        ops = [expand, lambda e: 2*e, expand, lambda e: e + 1]
+        derivation = Derivation(expr, x, a)
+        result = derivation.run(ops)
+        self.assertTrue(isinstance(result, dict))
+        self.assertEqual(1, result['step'])
+        self.assertEqual(1, derivation.broken_step)
+        self.assertEqual(expr, result['expr1'])
+        self.assertEqual(2*expr, result['expr2'])
+        # It stops at the broken step
+        self.assertEqual(3, len(derivation.expressions))
+
+    def test_apply(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        derivation = Derivation(Integral(exp(-a*x**2), (x, -oo, oo)), a)
+        result = derivation.apply(lambda e: sqrt(pi/a))
+        self.assertEqual(sqrt(pi/a), result)
+        result = derivation.apply(lambda e: e/2)
+        self.assertEqual(1, result['step'])
+        self.assertEqual(1, derivation.broken_step)
+
+    def test_complex_symbol_integral(self):
+        z = symbols("z", complex=True)
+        x = symbols("x", real=True)
+        expr = 2*Integral(im(z)*x**2, (x, -1, 1))
+        derivation = Derivation(expr, z, compare=Compare(convert_exceptions=True))
+        result = derivation.run([lambda e: Integral(im(2*z)*x**2, (x, -1, 1)), lambda e: 4*im(z)/3])
+        self.assertEqual(4*im(z)/3, result)
+
+    def test_missing_symbol(self):
+        b = symbols("b", positive=True)
+        z = symbols("z", complex=True)
+        derivation = Derivation(b*z, z)
+        result = derivation.apply(lambda e: e)
+        self.assertEqual(0, result['step'])
+        self.assertEqual("Result is still an expression. Check to be sure all free variables are passed in the compare call.",
+            result['exception'])
+
+    def test_compare_settings_apply(self):
+        """
+        Settings only Compare honours send every step through it
+        """
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        compare = Compare(profile=True)
+        ops = [expand, factor, lambda e: 2*e]
+        result = Derivation((x + a)**3*exp(-a*x), x, a, compare=compare).run(ops)
+        self.assertEqual(2, result['step'])
+        self.assertEqual(len(ops), compare.profile_summary.comparisons)
+        self.assertIn('profile', result)
+
+    def test_shared_compare(self):
+        """
+        A failure cached by the Compare is reported with each derivation's own step
+        """
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        expr = sin(a*x)**2*exp(-x)
+        compare = Compare()
+        first = Derivation(expr, x, a, compare=compare).apply(lambda e: 2*e)
+        second = Derivation(expr, x, a, compare=compare).run([lambda e: e, lambda e: 2*e])
+        self.assertEqual(0, first['step'])
+        self.assertEqual(1, second['step'])
+        self.assertNotIn('step', compare.compare(expr, 2*expr, x, a))
@@ -0,0 +1,62 @@
+import unittest
+from sympy import symbols, exp, cosh, sin, cos, conjugate, sqrt, oo, pi, erf, Integral, Piecewise, lerchphi, Rational, Float
+from checksym.util import build_test_value_sets
+from checksym.compare.impl import Evalf
+
+class TestEvalf(unittest.TestCase):
+
+    def assertAllPass(self, impl, *symbols):
+        for test_value_set in build_test_value_sets(*symbols):
+            self.assertEqual(None, impl.compare_for_symbols_with_test_values(test_value_set))
+
+    def test_complex(self):
+        z = symbols("z", complex=True)
+        self.assertAllPass(Evalf(exp(z)*sin(z)**2, exp(z)*(1 - cos(z)**2), (z,), 10, True), z)
+
+    def test_failure(self):
+        z = symbols("z", complex=True)
+        impl = Evalf(z, conjugate(z), (z,), 10, True)
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(z)[0])
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+    def test_values_below_float_range(self):
+        a = symbols("a", positive=True)
+        self.assertAllPass(Evalf(1/cosh(1000*a)**2, 4/(exp(1000*a) + exp(-1000*a))**2, (a,), 10, True), a)
+
+    def test_integral(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        z = symbols("z", complex=True)
+        self.assertAllPass(Evalf(Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), (a,), 10, True), a)
+        self.assertAllPass(Evalf(z*Integral(exp(-a*x**2), (x, -1, 1)), z*sqrt(pi/a)*erf(sqrt(a)), (a, z), 10, True), a, z)
+
+    def test_piecewise(self):
+        a = symbols("a", positive=True)
+        self.assertAllPass(Evalf(Piecewise((a, a > 1), (2*a, True)), Piecewise((a, a > 1), (a + a, True)), (a,), 10, True), a)
+
+    def test_function_lambdify_cannot_translate(self):
+        a = symbols("a", positive=True)
+        self.assertAllPass(Evalf(lerchphi(Rational(1, 2), 2, a), lerchphi(Rational(1, 2), 2, a), (a,), 10, True), a)
+
+    def test_cancellation(self):
+        """
+        Evaluated bottom up at a fixed precision, exp(a/10**20) - 1 keeps none of
+        its digits. The values are then evaluated again as whole trees, where evalf
+        raises the precision as it needs.
+        """
+        a = symbols("a", positive=True)
+        impl = Evalf(exp(a/10**20) - 1, a/10**20 + a**2/(2*10**40), (a,), 10, True)
+        bottom_up = impl._evaluate_tree(impl.expr1, {a: Float(Rational(13, 10), 20)}, 20, {})
+        self.assertGreater(abs(bottom_up - Rational(13, 10**21)), Rational(1, 10**22))
+        self.assertAllPass(impl, a)
+
+    def test_missing_free_variable(self):
+        a, b = symbols("a b", positive=True)
+        impl = Evalf(a*b, b*a, (a,), 10, True)
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0])
+        self.assertEqual("Result is still an expression. Check to be sure all free variables are passed in the compare call.",
+            result['exception'])
+
+if __name__ == '__main__':
+    unittest.main()
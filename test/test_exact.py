@@ -0,0 +1,52 @@
+import unittest
+from sympy import symbols, I, exp, sqrt, expand, conjugate
+from checksym.util import build_test_value_sets
+from checksym.compare.impl import Exact, is_rational_function
+
+class TestExact(unittest.TestCase):
+
+    def setUp(self):
+        self.z = symbols("z", complex=True)
+        self.x = symbols("x", real=True)
+
+    def test_is_rational_function(self):
+        (z, x) = (self.z, self.x)
+        self.assertTrue(is_rational_function((z + I*x/3)**5/(x - 2) + 7, (z, x)))
+        self.assertFalse(is_rational_function(exp(z), (z,)))
+        self.assertFalse(is_rational_function(sqrt(z), (z,)))
+        self.assertFalse(is_rational_function(conjugate(z), (z,)))
+        self.assertFalse(is_rational_function(0.5*z, (z,)))
+        self.assertFalse(is_rational_function(z*x, (z,)))
+
+    def test_same(self):
+        (z, x) = (self.z, self.x)
+        expr1 = (z + I*x/3)**7/(x - 2)
+        expr2 = expand((z + I*x/3)**7)/(x - 2)
+        self.assertEqual(None, Exact(expr1, expr2, (z, x)).compare(build_test_value_sets(z, x)))
+
+    def test_different(self):
+        (z, x) = (self.z, self.x)
+        exact = Exact((z + x)**2, z**2 + x**2, (z, x))
+        test_value_sets = build_test_value_sets(z, x)
+        result = exact.compare(test_value_sets)
+        self.assertEqual(test_value_sets[0], result['test_value_set'])
+        (z0, x0) = test_value_sets[0]
+        self.assertEqual(expand((z0 + x0)**2), result['expr1_final'])
+        self.assertEqual(expand(z0**2 + x0**2), result['expr2_final'])
+
+    def test_different_only_away_from_test_values(self):
+        x = self.x
+        test_value_sets = build_test_value_sets(x)
+        (a, b, c) = (value for (value,) in test_value_sets)
+        exact = Exact(x + (x - a)*(x - b)*(x - c), x, (x,))
+        result = exact.compare(test_value_sets)
+        self.assertEqual(None, result['test_value_set'])
+        self.assertFalse(result.get('error'))
+
+    def test_pole_at_test_value(self):
+        x = self.x
+        (a,) = build_test_value_sets(x)[0]
+        self.assertEqual(None, Exact(1/(x - a), (x + 1)/((x - a)*(x + 1)), (x,)).compare(build_test_value_sets(x)))
+
+if __name__ == '__main__':
+    unittest.main()
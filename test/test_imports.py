@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import unittest
+
+def loaded_modules(statements):
+    """
+    The numeric modules loaded after running statements in a new interpreter
+    """
+    script = statements + "\nimport sys\nprint(sorted(m for m in ('numpy', 'scipy', 'mpmath', 'sympy') if m in sys.modules))"
+    return subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout.strip()
+
+class TestImports(unittest.TestCase):
+
+    def test_import_checksym(self):
+        self.assertEqual("[]", loaded_modules("import checksym"))
+
+    def test_numpy_loaded_on_first_use(self):
+        self.assertEqual("['mpmath', 'sympy']", loaded_modules("from checksym import Compare, Derivation, remove\nCompare()"))
+        self.assertEqual("['mpmath', 'numpy', 'scipy', 'sympy']", loaded_modules(
+            "from checksym import Compare\nfrom sympy import symbols, sin, cos\n"
+            "x = symbols('x', real=True)\nassert Compare().compare(sin(x)**2, 1 - cos(x)**2, x) == None"))
+
+    def test_lazy_names(self):
+        import checksym
+        from checksym.compare import impl
+        self.assertTrue(callable(checksym.Compare))
+        self.assertTrue(callable(impl.SciPyNumPy))
+        with self.assertRaises(AttributeError):
+            checksym.missing
+
+    def test_lazy_names_listed(self):
+        import checksym
+        import checksym.compare
+        from checksym.compare import impl
+        for (module, names) in ((checksym, ['Compare', 'PersistentResultCache', 'Derivation', 'remove']),
+                (checksym.compare, ['Compare', 'PersistentResultCache', 'Derivation']),
+                (impl, ['SciPyNumPy', 'Evalf', 'Mpmath'])):
+            for name in names:
+                self.assertIn(name, module.__all__)
+                self.assertIn(name, dir(module))
+        self.assertEqual("['mpmath', 'sympy']", loaded_modules("from checksym import *\nassert callable(Compare)"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from checksym.util import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual({'size': 1, 'maxsize': 2, 'bytes': 0, 'maxbytes': None, 'hits': 1, 'misses': 1, 'evictions': 0},
+            cache.stats())
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(1, cache.evictions)
+
+    def test_evicts_by_size(self):
+        cache = LRUCache(maxsize=None, maxbytes=10, sizeof=lambda key, value: len(value))
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        cache.put('a', 'xxxxx')
+        self.assertEqual(9, cache.bytes)
+        cache.put('c', 'xx')
+        self.assertNotIn('b', cache)
+        self.assertEqual(7, cache.bytes)
+        cache.put('d', 'x' * 11)
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.bytes)
+
+    def test_get_or_compute_only_computes_once(self):
+        cache = LRUCache()
+        calls = []
+        def compute():
+            calls.append(1)
+            return 42
+        self.assertEqual(42, cache.get_or_compute('k', compute))
+        self.assertEqual(42, cache.get_or_compute('k', compute))
+        self.assertEqual(1, len(calls))
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.hits)
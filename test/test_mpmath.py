@@ -0,0 +1,87 @@
+import unittest
+import mpmath
+from sympy import symbols, exp, cosh, sin, cos, conjugate, sqrt, oo, nan, pi, Integral
+from sympy.utilities.lambdify import implemented_function
+from checksym.util import build_test_value_sets
+from checksym.compare.impl import Mpmath
+
+class TestMpmath(unittest.TestCase):
+
+    def assertAllPass(self, impl, *symbols):
+        for test_value_set in build_test_value_sets(*symbols):
+            self.assertEqual(None, impl.compare_for_symbols_with_test_values(test_value_set))
+
+    def test_complex(self):
+        z = symbols("z", complex=True)
+        self.assertAllPass(Mpmath(exp(z)*sin(z)**2, exp(z)*(1 - cos(z)**2), (z,), 10, True), z)
+
+    def test_imaginary_part_of_second_expression(self):
+        z = symbols("z", complex=True)
+        impl = Mpmath(z, conjugate(z), (z,), 10, True)
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(z)[0])
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+    def test_values_below_float_range(self):
+        a = symbols("a", positive=True)
+        self.assertAllPass(Mpmath(1/cosh(1000*a)**2, 4/(exp(1000*a) + exp(-1000*a))**2, (a,), 10, True), a)
+
+        impl = Mpmath(1/cosh(1000*a)**2, 3/(exp(1000*a) + exp(-1000*a))**2, (a,), 10, True)
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0])
+        self.assertNotEqual(None, result)
+        self.assertFalse(result.get('error'))
+
+    def test_escalates_precision(self):
+        """
+        exp(a/10**20) - 1 is 0 at the starting precision
+        """
+        a = symbols("a", positive=True)
+        impl = Mpmath(exp(a/10**20) - 1, a/10**20 + a**2/(2*10**40), (a,), 10, True)
+        self.assertAllPass(impl, a)
+
+        impl.escalation_dps = ()
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0])
+        self.assertTrue(result['error'])
+
+    def test_escalates_precision_for_near_miss(self):
+        """
+        exp(a/10**8) - 1 only has about 8 correct digits at the starting precision
+        """
+        a = symbols("a", positive=True)
+        impl = Mpmath(exp(a/10**8) - 1, a/10**8 + a**2/(2*10**16) + a**3/(6*10**24), (a,), 10, True)
+        self.assertAllPass(impl, a)
+
+        impl.escalation_dps = ()
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0])
+        self.assertNotEqual(None, result)
+
+    def test_no_escalation_for_clear_mismatch(self):
+        a = symbols("a", positive=True)
+        calls = []
+        f = implemented_function('f', lambda v: calls.append(v) or v)
+        impl = Mpmath(f(a), 2*f(a), (a,), 10, True)
+        self.assertNotEqual(None, impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0]))
+        self.assertEqual(2, len(calls))
+
+    def test_global_precision_untouched(self):
+        a = symbols("a", positive=True)
+        dps = []
+        f = implemented_function('f', lambda v: dps.append(mpmath.mp.dps) or v)
+        impl = Mpmath(exp(a/10**20) - 1 + f(a), a/10**20 + a**2/(2*10**40) + f(a), (a,), 10, True)
+        self.assertAllPass(impl, a)
+        self.assertEqual({15}, set(dps))
+
+    def test_nan(self):
+        a = symbols("a", positive=True)
+        impl = Mpmath(nan, a, (a,), 10, True)
+        result = impl.compare_for_symbols_with_test_values(build_test_value_sets(a)[0])
+        self.assertTrue(result['error'])
+        self.assertEqual("Some expression evaluated to NaN.", result['message'])
+
+    def test_integral(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        self.assertAllPass(Mpmath(Integral(exp(-a*x**2), (x, -oo, oo)), sqrt(pi/a), (a,), 10, True), a)
+
+if __name__ == '__main__':
+    unittest.main()
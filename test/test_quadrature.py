@@ -0,0 +1,94 @@
+import unittest
+import numpy
+from scipy.special import erf
+from sympy import symbols, Integral, exp, pi, oo, sin, I
+from sympy.physics.quantum import hbar
+from checksym.compare.impl.quadrature import integrate, evaluate
+from checksym.compare.exception import BatchUnsupportedException
+
+class TestQuadrature(unittest.TestCase):
+
+    def setUp(self):
+        self.x = symbols("x", real=True)
+        self.a = symbols("a", positive=True)
+        self.values = [numpy.array([0.5, 1.3, 4.0], dtype=complex)]
+
+    def assertIntegral(self, integral, expected):
+        (result, error) = integrate(integral, (self.a,), self.values)
+        a = self.values[0]
+        numpy.testing.assert_allclose(result, expected(a), rtol=1e-12)
+
+    def test_finite(self):
+        self.assertIntegral(Integral(sin(self.a*self.x), (self.x, 0, pi)), lambda a: (1 - numpy.cos(a*numpy.pi))/a)
+
+    def test_finite_with_symbolic_limit(self):
+        self.assertIntegral(Integral(self.x**2, (self.x, -self.a, 2*self.a)), lambda a: 3*a**3)
+
+    def test_infinite(self):
+        self.assertIntegral(Integral(exp(-self.a*self.x**2), (self.x, -oo, oo)), lambda a: numpy.sqrt(numpy.pi/a))
+
+    def test_infinite_reversed(self):
+        self.assertIntegral(Integral(exp(-self.a*self.x**2), (self.x, oo, -oo)), lambda a: -numpy.sqrt(numpy.pi/a))
+
+    def test_half_infinite(self):
+        self.assertIntegral(Integral(exp(-self.a*self.x), (self.x, 1, oo)), lambda a: numpy.exp(-a)/a)
+        self.assertIntegral(Integral(exp(self.a*self.x), (self.x, -oo, 1)), lambda a: numpy.exp(a)/a)
+        self.assertIntegral(Integral(exp(-self.a*self.x), (self.x, oo, 1)), lambda a: -numpy.exp(-a)/a)
+        self.assertIntegral(Integral(exp(self.a*self.x), (self.x, 1, -oo)), lambda a: -numpy.exp(a)/a)
+
+    def test_slow_decay(self):
+        self.assertIntegral(Integral(1/(self.a**2 + self.x**2), (self.x, -oo, oo)), lambda a: numpy.pi/a)
+
+    def test_complex_integrand(self):
+        z = symbols("z", complex=True)
+        values = [numpy.array([1.3 + 2.6j, 0.5 - 0.1j])]
+        (result, _) = integrate(Integral(exp(-(1 + I)*self.x**2 + z*self.x), (self.x, -oo, oo)), (z,), values)
+        z = values[0]
+        numpy.testing.assert_allclose(result, numpy.sqrt(numpy.pi/(1 + 1j))*numpy.exp(z**2/(4*(1 + 1j))), rtol=1e-12)
+
+    def test_real_integral_has_zero_imaginary_part(self):
+        (result, _) = integrate(Integral(exp(-self.x**2/self.a**2), (self.x, -1, 1)), (self.a,), self.values)
+        self.assertTrue((result.imag == 0).all())
+
+    def test_does_not_converge(self):
+        with self.assertRaises(BatchUnsupportedException):
+            integrate(Integral(exp(-self.x**2/hbar**2), (self.x, -oo, oo)), (self.a,), self.values)
+
+    def test_peak_between_nodes(self):
+        """
+        A peak narrower than the gaps between nodes makes every level zero, which
+        mustn't count as converged
+        """
+        with self.assertRaises(BatchUnsupportedException):
+            integrate(Integral(exp(-10**6*self.x**2), (self.x, -1, 1)), (self.a,), self.values)
+        with self.assertRaises(BatchUnsupportedException):
+            integrate(Integral(exp(-10**6*(self.x - 5)**2), (self.x, -oo, oo)), (self.a,), self.values)
+
+    def test_multiple_limits(self):
+        y = symbols("y", real=True)
+        integral = Integral(exp(-self.a*(self.x**2 + y**2)), (self.x, -oo, oo), (y, -oo, oo))
+        self.assertIntegral(integral, lambda a: numpy.pi/a)
+
+    def test_multiple_limits_depending_on_outer_variable(self):
+        y = symbols("y", real=True)
+        integral = Integral(self.a*self.x*y, (self.x, 0, y), (y, 0, 1))
+        self.assertIntegral(integral, lambda a: a/8)
+
+    def test_three_dimensions(self):
+        y, z = symbols("y z", real=True)
+        integral = Integral(exp(-self.a*(self.x**2 + y**2 + z**2)), (self.x, -oo, oo), (y, 0, 1), (z, 0, 1))
+        self.assertIntegral(integral, lambda a: numpy.sqrt(numpy.pi/a)*(numpy.sqrt(numpy.pi/a)/2*erf(numpy.sqrt(a)))**2)
+
+    def test_nested(self):
+        y = symbols("y", real=True)
+        integral = Integral(y**2*Integral(exp(-self.a*self.x**2 - y**2), (self.x, -oo, oo)), (y, -1, 1))
+        self.assertIntegral(integral, lambda a: numpy.sqrt(numpy.pi/a)*0.37894469164098205)
+
+    def test_evaluate_expression_with_integrals(self):
+        expr = self.a**2*Integral(exp(-self.a*self.x**2), (self.x, -oo, oo)) + Integral(self.x, (self.x, 0, self.a))
+        result = evaluate(expr, (self.a,), self.values)
+        a = self.values[0]
+        numpy.testing.assert_allclose(result, a**2*numpy.sqrt(numpy.pi/a) + a**2/2, rtol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
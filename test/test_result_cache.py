@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from sympy import symbols, exp
+from sympy.utilities.lambdify import implemented_function
+from checksym import Compare, PersistentResultCache
+
+class TestPersistentResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+        z = symbols("z", complex=True)
+        cache = PersistentResultCache(self.path)
+        self.assertEqual((False, None, None), cache.get(z, 2*z, (z,)))
+        cache.put(z, 2*z, (z,), {'expr1': z}, {'total': 1.5})
+        self.assertEqual((True, {'expr1': z}, {'total': 1.5}), PersistentResultCache(self.path).get(z, 2*z, (z,)))
+
+    def test_key_depends_on_assumptions(self):
+        x_real = symbols("x", real=True)
+        x_complex = symbols("x", complex=True, real_part_positive=True)
+        x_complex_2 = symbols("x", complex=True, real_part_negative=True)
+        keys = {PersistentResultCache.key(x, 2*x, (x,)) for x in (x_real, x_complex, x_complex_2)}
+        self.assertEqual(3, len(keys))
+
+    def test_prune(self):
+        x = symbols("x")
+        cache = PersistentResultCache(self.path)
+        for i in range(5):
+            cache.put(x, x + i, (x,), {'i': i}, {})
+        cache.get(x, x, (x,))
+        self.assertEqual(2, cache.prune(max_entries=3))
+        self.assertEqual(3, cache.stats()['entries'])
+        self.assertTrue(cache.get(x, x, (x,))[0])
+        self.assertFalse(cache.get(x, x + 1, (x,))[0])
+        size = cache.stats()['bytes']
+        cache.prune(max_bytes=size - 1)
+        self.assertEqual(2, cache.stats()['entries'])
+
+    def test_max_entries(self):
+        x = symbols("x")
+        cache = PersistentResultCache(self.path, max_entries=2)
+        for i in range(5):
+            cache.put(x, x + i, (x,), None, {})
+        self.assertEqual(2, cache.stats()['entries'])
+
+    def test_compare_skips_evaluation_when_cached(self):
+        z = symbols("z", complex=True)
+        Compare(result_cache=PersistentResultCache(self.path)).compare(exp(z)**2, exp(2*z), z)
+        failure = Compare(result_cache=PersistentResultCache(self.path)).compare(z, 2*z, z)
+        phases = []
+        compare = Compare(result_cache=PersistentResultCache(self.path), on_phase=phases.append)
+        self.assertEqual(None, compare.compare(exp(z)**2, exp(2*z), z))
+        self.assertEqual(failure['expr1_final'], compare.compare(z, 2*z, z)['expr1_final'])
+        self.assertEqual([], phases)
+
+    def test_key_depends_on_settings(self):
+        z = symbols("z", complex=True)
+        keys = {PersistentResultCache.key(z, 2*z, (z,), settings)
+            for settings in ((), (('tiers', ('float',)),), (('tiers', ('float', 'doit')),))}
+        self.assertEqual(3, len(keys))
+
+        cache = PersistentResultCache(self.path)
+        Compare(result_cache=cache, tiers=('float',)).compare(exp(z)**2, exp(2*z), z)
+        phases = []
+        Compare(result_cache=cache, on_phase=phases.append).compare(exp(z)**2, exp(2*z), z)
+        self.assertNotEqual([], phases)
+
+    def test_uncertain_results_not_stored(self):
+        x = symbols("x", real=True)
+        def fail(v):
+            raise ValueError("fail")
+        f = implemented_function('fail', fail)
+        cache = PersistentResultCache(self.path)
+        self.assertTrue(Compare(result_cache=cache).compare(f(x), x, x)['exception'])
+        Compare(result_cache=cache, test_time_limit=1).compare(exp(x)**2, exp(2*x), x)
+        self.assertEqual(0, cache.stats()['entries'])
+
+if __name__ == '__main__':
+    unittest.main()
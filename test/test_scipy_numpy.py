@@ -0,0 +1,84 @@
+import unittest
+import inspect
+from sympy import symbols, Rational, Integral, exp, sin, cos, oo, sqrt, pi, Tuple
+from sympy.physics.quantum import hbar
+from checksym.util import build_test_value_sets
+from checksym.compare.impl import SciPyNumPy, compile_expression
+from checksym.compare.exception import BatchUnsupportedException
+
+class TestSciPyNumPy(unittest.TestCase):
+
+    def test_batch_success(self):
+        z = symbols("z", complex=True)
+        x = symbols("x", real=True)
+        impl = SciPyNumPy(exp(z)*sin(x)**2, exp(z)*(1 - exp(2*x*1j)/4 - exp(-2*x*1j)/4 - 1/2), (z, x), 10, True)
+        self.assertEqual(None, impl.compare_for_symbols_with_test_value_sets(build_test_value_sets(z, x)))
+
+    def test_batch_reports_first_failing_test_value_set(self):
+        x = symbols("x", real=True)
+        # Only differs when x is negative, which is the third test value set
+        impl = SciPyNumPy(x**2 + x, x**2 + abs(x), (x,), 10, True)
+        test_value_sets = build_test_value_sets(x)
+        result = impl.compare_for_symbols_with_test_value_sets(test_value_sets)
+        self.assertEqual(test_value_sets[2], result['test_value_set'])
+        self.assertFalse(result.get('error'))
+        self.assertAlmostEqual(-12/5 + (12/5)**2, result['expr1_final'])
+        self.assertAlmostEqual(12/5 + (12/5)**2, result['expr2_final'])
+
+    def test_batch_integral(self):
+        x, a = symbols("x a", positive=True)
+        impl = SciPyNumPy(Integral(exp(-a*x), (x, 0, oo)), 1/a, (a,), 10, True)
+        self.assertEqual(None, impl.compare_for_symbols_with_test_value_sets(build_test_value_sets(a)))
+
+    def test_batch_unsupported_for_integral_that_does_not_converge(self):
+        """
+        The integrand is a spike far narrower than any node spacing
+        """
+        x, a = symbols("x a", positive=True)
+        impl = SciPyNumPy(Integral(exp(-x**2/hbar**2), (x, -oo, oo))*a, a*sqrt(pi)*hbar, (a,), 10, True)
+        with self.assertRaises(BatchUnsupportedException):
+            impl.compare_for_symbols_with_test_value_sets(build_test_value_sets(a))
+
+    def test_batch_after_doit(self):
+        x, a = symbols("x a", positive=True)
+        impl = SciPyNumPy(Integral(exp(-a*x), (x, 0, oo)), 1/a, (a,), 10, True)
+        impl.do_sympy_doit_first = True
+        self.assertEqual(None, impl.compare_for_symbols_with_test_value_sets(build_test_value_sets(a)))
+
+    def test_evaluate_values_at_given_sets(self):
+        """
+        The values are for the test value sets passed in, not the symbol's defaults
+        """
+        x = symbols("x", real=True)
+        impl = SciPyNumPy(x**2, x**2, (x,), 10, True)
+        self.assertEqual([4, 9], list(impl.evaluate_values(x**2, [[Rational(2)], [Rational(3)]])))
+        self.assertEqual([16], list(impl.evaluate_values(x**2, [[Rational(4)]])))
+
+    def test_joint_cse(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        shared = Integral(exp(-a*x**2)*cos(x), (x, -oo, oo))
+        impl = SciPyNumPy(shared*sin(a)**2, shared*(1 - cos(a)**2), (a,), 10, True)
+        impl.joint_cse = True
+        test_value_sets = build_test_value_sets(a)
+        self.assertEqual(None, impl.compare_for_symbols_with_test_value_sets(test_value_sets))
+        for test_value_set in test_value_sets:
+            self.assertEqual(None, impl.compare_for_symbols_with_test_values(test_value_set))
+
+        # The shared integral is integrated once per test value set
+        joint_fn = compile_expression(Tuple(impl.expr1, impl.expr2), (a,), ['scipy', 'numpy'], cse=True)
+        self.assertEqual(1, inspect.getsource(joint_fn).count('quad('))
+
+    def test_joint_cse_failure(self):
+        x = symbols("x", real=True)
+        a = symbols("a", positive=True)
+        shared = Integral(exp(-a*x**2)*cos(x), (x, -oo, oo))
+        impl = SciPyNumPy(shared*sin(a), shared*cos(a), (a,), 10, True)
+        impl.joint_cse = True
+        test_value_set = build_test_value_sets(a)[0]
+        result = impl.compare_for_symbols_with_test_values(test_value_set)
+        self.assertFalse(result.get('error'))
+        self.assertNotAlmostEqual(result['expr1_final'], result['expr2_final'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from checksym.util import fold_tree, rebuild
+from sympy import Integral, symbols, sin, exp
+
+class TestTraversal(unittest.TestCase):
+
+    def test_fold_tree(self):
+        x, y = symbols("x y")
+        expr = sin(x + y) + exp(x + y)
+        combined = []
+        def count(node, values):
+            combined.append(node)
+            return 1 + sum(values)
+        self.assertEqual(9, fold_tree(expr, count))
+        # x + y is shared, so combined once
+        self.assertEqual(1, combined.count(x + y))
+
+    def test_fold_tree_deep(self):
+        x, z = symbols("x z")
+        expr = x
+        for _ in range(1000):
+            expr = sin(expr + z)
+        depth = lambda node, values: 1 + max(values, default=0)
+        self.assertEqual(2001, fold_tree(expr, depth))
+
+    def test_fold_tree_memo_and_descend(self):
+        x, y = symbols("x y")
+        memo = {}
+        nodes = lambda node, values: 1 + sum(values)
+        integral = Integral(x*y, (x, 0, 1))
+        self.assertEqual(3, fold_tree(integral + y, nodes, memo, descend=lambda node: not isinstance(node, Integral)))
+        self.assertEqual(1, memo[integral])
+        self.assertNotIn(x*y, memo)
+
+    def test_rebuild(self):
+        x, y = symbols("x y")
+        expr = sin(x + y)
+        self.assertIs(expr, rebuild(expr, list(expr.args)))
+        self.assertEqual(sin(x), rebuild(expr, [x]))